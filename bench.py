@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import sys, os, random, shutil, subprocess, tempfile, time
+from optparse import OptionParser
+
+from sqlalchemy import event
+
+import saobjects as sao
+from tabulator import Tabulator
+
+class NullFile(object):
+    def write(self, s):
+        pass
+    def close(self):
+        pass
+
+def synthetic_harness(conductors, units=20, conns_per_unit=10,
+        pins_per_conn=37, cdrs_per_cable=20, seed=1):
+    # Conductor rows for Interconnect.import_cdrs. Each cable runs between
+    # two connectors on different units, conductor n of the cable landing on
+    # pin n of each connector, wrapping once the connector is full.
+    rng = random.Random(seed)
+    unit_names = ['U%d' % unit for unit in range(1, units + 1)]
+    conn_names = ['J%d' % conn for conn in range(1, conns_per_unit + 1)]
+
+    rows = []
+    cable = 0
+    while len(rows) < conductors:
+        cable += 1
+        a_unit, b_unit = rng.sample(unit_names, 2)
+        a_conn, b_conn = rng.choice(conn_names), rng.choice(conn_names)
+        first_pin = rng.randrange(pins_per_conn)
+        for cdr in range(min(cdrs_per_cable, conductors - len(rows))):
+            pin = str((first_pin + cdr) % pins_per_conn + 1)
+            rows.append([a_unit, a_conn, pin, b_unit, b_conn, pin,
+                str(cable), 'C'])
+    return rows
+
+class Benchmark(object):
+
+    def __init__(self, dburi):
+        self.ic = sao.Interconnect(dburi, debug=False)
+        self.statements = 0
+        event.listen(self.ic.engine, 'before_cursor_execute',
+                self._count_statement)
+        self.results = []
+
+    def _count_statement(self, conn, cursor, statement, parameters, context,
+            executemany):
+        self.statements += 1
+
+    def timed(self, name, run, *args):
+        stdout = sys.stdout
+        sys.stdout = NullFile()
+        statements = self.statements
+        start = time.time()
+        try:
+            try:
+                run(*args)
+                status = ''
+            except Exception, exc:
+                status = 'failed: %s' % exc
+        finally:
+            elapsed = time.time() - start
+            sys.stdout = stdout
+        self.results.append((name, elapsed, self.statements - statements,
+            status))
+
+    def run(self, rows, adds=10):
+        ic = self.ic
+        self.timed('import', ic.import_cdrs, rows)
+        self.timed('conn_tables', ic.conn_tables, NullFile(), False)
+        # Rendered sections are cached, so the PCID table is timed cold too.
+        ic._invalidate()
+        self.timed('conn_tables (pcids)', ic.conn_tables, NullFile())
+        self.timed('conn_tables (cached)', ic.conn_tables, NullFile())
+        self.timed('cdr_table', ic.cdr_table, NullFile())
+        self.timed('massemit', ic.unit_conn_tables, lambda unit: NullFile())
+        # The first completion builds the prefix index shared by both, so
+        # each is timed cold on a fresh index and then cached.
+        for name, complete, args in [
+                ('complete_unit', ic.complete_unit, ('',)),
+                ('complete_conn', ic.complete_conn, (rows[0][0], ''))]:
+            ic._invalidate()
+            self.timed(name, complete, *args)
+            self.timed(name + ' (cached)', complete, *args)
+
+        def add_cdrs():
+            for add in range(adds):
+                ic.add_cdr('BENCH', 'P1', str(add + 1),
+                        rows[0][0], rows[0][1], rows[0][2])
+        self.timed('add_cdr x%d' % adds, add_cdrs)
+
+        self.timed('renumber_nets', ic.renumber_nets, None)
+        self.timed('reorient_cdrs', ic.reorient_cdrs)
+        self.timed('del_net', ic.del_net, 'BENCH', 1)
+
+def startup_times(db_path, runs):
+    # Wall time of fresh interpreters importing the command line, and running
+    # a script that binds an existing database and emits one unit.
+    cl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cl.py')
+    script_path = os.path.join(os.path.dirname(db_path), 'startup.bn')
+    script = open(script_path, 'w')
+    script.write('bind sqlite:///%s\nfilterunits U1\nemit %s\n' %
+            (db_path, os.devnull))
+    script.close()
+
+    commands = [
+        ('import cl', [sys.executable, '-c', 'import cl'],
+            os.path.dirname(cl_path)),
+        ('bind and emit', [sys.executable, cl_path, 'run', script_path], None),
+    ]
+    devnull = open(os.devnull, 'w')
+    results = []
+    for name, argv, cwd in commands:
+        times = []
+        for run in range(runs):
+            start = time.time()
+            subprocess.check_call(argv, stdout=devnull, cwd=cwd)
+            times.append(time.time() - start)
+        results.append((name, min(times), sum(times) / len(times)))
+    devnull.close()
+    return results
+
+def startup_main(options):
+    db_dir = tempfile.mkdtemp(prefix='bnbench')
+    try:
+        db_path = os.path.join(db_dir, 'bench.db')
+        bench = Benchmark('sqlite:///%s' % db_path)
+        rows = synthetic_harness(1000, options.units, options.conns,
+                options.pins, options.cable_size, options.seed)
+        bench.timed('import', bench.ic.import_cdrs, rows)
+        results = startup_times(db_path, options.startup)
+    finally:
+        shutil.rmtree(db_dir)
+
+    t = Tabulator(24, 10, 10)
+    print t('Startup', 'Min', 'Mean')
+    for name, fastest, mean in results:
+        print t(name, '%.3f' % fastest, '%.3f' % mean)
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--scale', default='1000,10000,100000',
+            help='comma separated conductor counts to run at')
+    parser.add_option('-u', '--units', type='int', default=20)
+    parser.add_option('-c', '--conns', type='int', default=10,
+            help='connectors per unit')
+    parser.add_option('-p', '--pins', type='int', default=37,
+            help='pins per connector')
+    parser.add_option('-k', '--cable-size', type='int', default=20,
+            help='conductors per cable')
+    parser.add_option('--seed', type='int', default=1)
+    parser.add_option('--startup', type='int', default=0, metavar='RUNS',
+            help='time command line startup over RUNS runs instead')
+    options, args = parser.parse_args()
+
+    if options.startup:
+        startup_main(options)
+        return
+
+    t = Tabulator(12, 24, 10, 12, 40)
+    print t('Conductors', 'Operation', 'Seconds', 'Statements', '')
+    for scale in [int(scale) for scale in options.scale.split(',')]:
+        rows = synthetic_harness(scale, options.units, options.conns,
+                options.pins, options.cable_size, options.seed)
+
+        db_dir = tempfile.mkdtemp(prefix='bnbench')
+        try:
+            bench = Benchmark('sqlite:///%s' %
+                    os.path.join(db_dir, 'bench.db'))
+            bench.run(rows)
+        finally:
+            shutil.rmtree(db_dir)
+
+        for name, elapsed, statements, status in bench.results:
+            print t(scale, name, '%.3f' % elapsed, statements, status)
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,297 @@
 #!/usr/bin/python
 
-import sys, cmd
-import saobjects as sao
+import sys, cmd, csv, getopt, time
+from profiling import Profiler
+from jobs import Job
+from tabulator import Tabulator
 import readline
 
+class ReplacementFile(object):
+    # Collects the new content of a file and only writes it out if it
+    # differs from what the file already holds, so unchanged files keep
+    # their timestamps.
+    def __init__(self, path, written):
+        self._path = path
+        self._written = written
+        self._buf = []
+
+    def write(self, s):
+        self._buf.append(s)
+
+    def close(self):
+        content = ''.join(self._buf)
+        try:
+            old_file = file(self._path, 'rb')
+            try:
+                unchanged = old_file.read() == content
+            finally:
+                old_file.close()
+        except IOError:
+            unchanged = False
+
+        if not unchanged:
+            output_file = file(self._path, 'w')
+            try:
+                output_file.write(content)
+            finally:
+                output_file.close()
+            self._written.append(self._path)
+
 class Birdnest(cmd.Cmd):
 
+    # Argument counts accepted by each command, checked when the command
+    # runs and for every line of a script before any of it is run.
+    arg_counts = {
+        'ac': [6, 7],
+        'addcable': [6, 7],
+        'import': [1],
+        'bind': [1, 2],
+        'ap': [4],
+        'rmcdr': [2],
+        'descp': [2],
+        'rmnet': [2],
+        'rmcable': [1],
+        'rmunit': [1],
+        'chpin': [3],
+        'renumbernets': [1],
+        'setsub': [3],
+        'setkind': [3],
+        'trace': [3, 6],
+        }
+    arg_splits = { 'descp': 1 }
+    unscriptable = ['begin', 'commit', 'rollback', 'source', 'use', 'exit',
+            'EOF']
+
     def __init__(self):
         cmd.Cmd.__init__(self)
         self.prompt = "BN> "
         self.ic = None
+        self.ics = {}
+        self.alias = None
+        self.jobs = []
+        self._job_count = 0
+        self._strict = False
+        self.profiler = Profiler()
         default_delims = readline.get_completer_delims()
         new_delims = ''.join((c not in '-/[]') and c or ''
                              for c in default_delims)
         readline.set_completer_delims(new_delims)
 
-    def _required_args(self, args, required):
+    def onecmd(self, line):
+        self.profiler.begin(self.parseline(line)[0] or 'emptyline')
+        try:
+            return cmd.Cmd.onecmd(self, line)
+        finally:
+            self.profiler.end()
+
+    def postcmd(self, stop, line):
+        self._reap_jobs()
+        return stop
+
+    def _start_job(self, description, run):
+        self._job_count += 1
+        job = Job(self._job_count, description, run)
+        self.jobs.append(job)
+        job.start()
+        print '[%d] %s' % (job.num, description)
+
+    def _reap_jobs(self, wait=False):
+        # Reports and forgets the jobs which have finished, or with wait,
+        # all of them once they have.
+        for job in list(self.jobs):
+            if wait:
+                job.wait()
+            if job.running:
+                continue
+            print '[%d] %s %s (%.1fs, %s)' % (job.num, job.state,
+                    job.description, job.elapsed, job.progress)
+            if job.error:
+                print '***', job.error
+            elif job.result:
+                print job.result
+            self.jobs.remove(job)
+
+    def _required_args(self, args, required, where=''):
         if len(args) not in required:
-            print '*** command requires %s args (%s given)' \
-                    % (', '.join([str(r) for r in required]),
+            print '***%s command requires %s args (%s given)' \
+                    % (where, ', '.join([str(r) for r in required]),
                         str(len(args)))
             return True
 
+    def _report_error(self, exc):
+        if self._strict:
+            raise
+        print '***', exc
+        if self.ic and self.ic.end_failed_batch():
+            print '*** batch rolled back'
+            self._set_prompt()
+
+    def _set_prompt(self):
+        # The alias in use is shown once more than one database is bound.
+        prompt = "BN"
+        if len(self.ics) > 1:
+            prompt += " " + self.alias
+        if self.ic and self.ic.in_batch:
+            prompt += " [batch]"
+        self.prompt = prompt + "> "
+
+    def _parse_script(self, path):
+        script_file = file(path)
+        try:
+            lines = list(script_file)
+        finally:
+            script_file.close()
+
+        script = []
+        valid = True
+        for line_num, line in enumerate(lines):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            where = ' line %d:' % (line_num + 1)
+            cmd_name, arg, line = self.parseline(line)
+            if (not cmd_name or cmd_name in self.unscriptable
+                    or not hasattr(self, 'do_' + cmd_name)
+                    or (cmd_name == 'bind' and script)):
+                print '***%s cannot run %s in a script' % (where, line)
+                valid = False
+                continue
+
+            if cmd_name in self.arg_counts:
+                args = arg.split(None, self.arg_splits.get(cmd_name, -1))
+                if self._required_args(args, self.arg_counts[cmd_name],
+                        where):
+                    valid = False
+                    continue
+
+            script.append((line_num + 1, cmd_name, arg))
+
+        return script, valid
+
+    def run_script(self, path):
+        # Runs every command in the script as one transaction, or joins the
+        # open batch if there is one. Returns True if the whole script was
+        # applied.
+        try:
+            script, valid = self._parse_script(path)
+        except IOError, exc:
+            print '***', exc
+            return False
+        if not valid:
+            print '*** %s was not run' % path
+            return False
+
+        if script and script[0][1] == 'bind':
+            if self.ic and self.ic.in_batch:
+                print '*** cannot bind a script while a batch is open'
+                return False
+            self.do_bind(script.pop(0)[2])
+        if not self.ic:
+            print '*** no interconnect is bound'
+            return False
+
+        own_batch = not self.ic.in_batch
+        if own_batch:
+            self.ic.begin()
+
+        timings = {}
+        def timed(cmd_name, run, *args):
+            start = time.time()
+            self.profiler.begin(cmd_name)
+            try:
+                run(*args)
+            finally:
+                self.profiler.end()
+            elapsed = time.time() - start
+            cmd_count, cmd_time, cmd_max = timings.get(cmd_name, (0, 0.0, 0.0))
+            timings[cmd_name] = (cmd_count + 1, cmd_time + elapsed,
+                    max(cmd_max, elapsed))
+
+        start = time.time()
+        self._strict = True
+        try:
+            for line_num, cmd_name, arg in script:
+                where = ' line %d:' % line_num
+                timed(cmd_name, getattr(self, 'do_' + cmd_name), arg)
+
+            if own_batch:
+                where = ' commit:'
+                timed('commit', self.ic.commit)
+
+        except Exception, exc:
+            print '***%s %s' % (where, exc)
+            if self.ic.in_batch:
+                self.ic.rollback()
+            print '*** %s was rolled back%s' % (path,
+                    '' if own_batch else ' along with the open batch')
+            return False
+
+        finally:
+            self._strict = False
+            self._set_prompt()
+
+        t = Tabulator(14, 8, 10, 10, 10)
+        t.write(sys.stdout, [('Command', 'Count', 'Total', 'Mean', 'Max')]
+                + [(cmd_name, cmd_count, '%.4f' % cmd_time,
+                    '%.4f' % (cmd_time / cmd_count), '%.4f' % cmd_max)
+                   for cmd_name, (cmd_count, cmd_time, cmd_max)
+                   in sorted(timings.items())])
+        print ' - ran %d commands from %s in %.3fs%s' % (
+                len(script), path, time.time() - start,
+                '' if own_batch else ' (batch not committed)')
+        return True
+
+    def _pcid_list(self, arg):
+        pin_cids = []
+        for cid_range in arg.split(','):
+            first, _, last = cid_range.partition('-')
+            pin_cids.extend(range(int(first), int(last or first) + 1))
+        return pin_cids
+
+    def _desig_list(self, arg):
+        desigs = []
+        for desig_range in arg.split(','):
+            first, _, last = desig_range.partition('-')
+            if first.isdigit() and last.isdigit():
+                desigs.extend(str(desig)
+                              for desig in range(int(first), int(last) + 1))
+            else:
+                desigs.append(desig_range)
+        return desigs
+
     def emptyline(self):
         self.ic.conn_tables(sys.stdout)
+    def help_emit(self):
+        print """\
+            emit [-b] <file>
+
+            Write the pin table to <file>, without PCIDs. With -b, the
+            table is written by a background job (see jobs), leaving the
+            command line free meanwhile.
+            """
     def do_emit(self, s):
-        output_file = file(s, 'w')
-        self.ic.conn_tables(output_file, show_pcids=False)
-        output_file.close()
+        try:
+            opts, args = getopt.getopt(s.split(), 'b')
+            if not opts:
+                output_file = file(' '.join(args), 'w')
+                try:
+                    self.ic.conn_tables(output_file, show_pcids=False)
+                finally:
+                    output_file.close()
+                return
+
+            write = self.ic.snapshot_conn_tables()
+            job_file = file(' '.join(args), 'w')
+            def run(job):
+                output_file = job.counted(job_file)
+                try:
+                    write(job, output_file, job.unit_done)
+                finally:
+                    output_file.close()
+            self._start_job('emit ' + s, run)
+        except Exception, exc:
+            self._report_error(exc)
     def help_exit(self):
         print """\
             exit
@@ -35,30 +299,316 @@ class Birdnest(cmd.Cmd):
             Exit Birdnest
             """
     def do_exit(self, s):
+        if self.jobs:
+            print '*** waiting for %d background jobs' % len(self.jobs)
+            self._reap_jobs(wait=True)
+        for alias, ic in sorted(self.ics.items()):
+            if ic.in_batch:
+                ic.rollback()
+                print '*** uncommitted batch on %s rolled back' % alias
         return True
     do_EOF = do_exit
 
+    def help_source(self):
+        print """\
+            source <file>
+
+            Run the commands in <file>, one per line, with blank lines and
+            lines starting with # ignored. Every line is checked before
+            anything is run, then the whole script is applied in one
+            transaction (or as part of the open batch) and rolled back if
+            any command fails. A summary of the time taken by each command
+            is printed at the end. A script may start with a bind command.
+
+            Scripts can also be run from the shell with: cl.py run <file>
+            """
+    def do_source(self, s):
+        args = s.split()
+
+        if self._required_args(args, [1]):
+            return
+
+        self.run_script(args[0])
+
+    def help_begin(self):
+        print """\
+            begin
+
+            Start a batch. Changes made by the following commands are kept
+            in one transaction, and are only saved by commit or discarded
+            by rollback. A command that fails at the database rolls back
+            the whole batch.
+            """
+    def do_begin(self, s):
+        try:
+            self.ic.begin()
+        except Exception, exc:
+            self._report_error(exc)
+        self._set_prompt()
+
+    def help_commit(self):
+        print """\
+            commit
+
+            Save the changes made since begin and end the batch.
+            """
+    def do_commit(self, s):
+        try:
+            self.ic.commit()
+        except Exception, exc:
+            self._report_error(exc)
+        self._set_prompt()
+
+    def help_rollback(self):
+        print """\
+            rollback
+
+            Discard the changes made since begin and end the batch.
+            """
+    def do_rollback(self, s):
+        try:
+            self.ic.rollback()
+        except Exception, exc:
+            self._report_error(exc)
+        self._set_prompt()
+
+    def help_massemit(self):
+        print """\
+            massemit [-b] [--changed-since <mark>] [<prefix>]
+
+            Emit the pin table of each unit to its own file, named
+            <prefix><unit>.il with the unit name in lower case, from one
+            read of the interconnect. Files whose content has not changed
+            are not rewritten. With --changed-since, only units changed
+            after journal mark <mark> are rendered. The current mark is
+            printed at the end (see also mark). With -b, the files are
+            rendered by a background job (see jobs).
+            """
     def do_massemit(self, s):
-        units = self.ic.complete_unit('')
+        units = None
+        background = False
+
+        try:
+            opts, args = getopt.getopt(s.split(), 'b', ['changed-since='])
+            prefix = ' '.join(args)
+            mark = self.ic.journal_mark()
+            for opt, value in opts:
+                if opt == '-b':
+                    background = True
+                else:
+                    units = self.ic.changed_units(int(value))
+
+            written = []
+            rendered = []
+            def open_unit_file(unit):
+                rendered.append(unit)
+                return ReplacementFile("%s%s.il" % (prefix, unit.lower()),
+                        written)
+
+            def summary():
+                return " - wrote %d of %d unit files, journal mark %d" % (
+                        len(written), len(rendered), mark)
+
+            if not background:
+                self.ic.unit_conn_tables(open_unit_file, units=units)
+                print summary()
+                return
+
+            write = self.ic.snapshot_unit_conn_tables(units)
+            def run(job):
+                write(job, lambda unit:
+                        job.counted(open_unit_file(unit), True))
+                return summary()
+            self._start_job('massemit ' + s, run)
+        except Exception, exc:
+            self._report_error(exc)
 
-        for unit in units:
-            output_file = file("%s%s.il" % (s, unit.strip().lower()), 'w')
-            self.ic.unit_display_filter = [unit.strip()]
-            self.ic.conn_tables(output_file, show_pcids=False)
-            output_file.close()
+    def help_mark(self):
+        print """\
+            mark
+
+            Print the current change journal mark, for use with
+            massemit --changed-since.
+            """
+    def do_mark(self, s):
+        print self.ic.journal_mark()
 
+    def help_cdrcheck(self):
+        print """\
+            cdrcheck [-c] [-b <file>]
+
+            List every conductor with the pins at each end. Without -c, a
+            conductor is listed once for each pair of pins on its two nets.
+            With -c, each conductor is listed once, each end showing the
+            first pin of its net (marked + if the net has more pins), and
+            the pins of those multi-pin nets are listed once at the end.
+            With -b, the list is written to <file> by a background job (see
+            jobs).
+            """
     def do_cdrcheck(self, s):
-        self.ic.cdr_table(sys.stdout)
+        try:
+            opts, args = getopt.getopt(s.split(), 'cb:')
+            opts = dict(opts)
+            compact = '-c' in opts
+            if '-b' not in opts:
+                self.ic.cdr_table(sys.stdout, compact=compact)
+                return
+
+            write = self.ic.snapshot_cdr_table(compact)
+            job_file = file(opts['-b'], 'w')
+            def run(job):
+                output_file = job.counted(job_file)
+                try:
+                    write(job, output_file)
+                finally:
+                    output_file.close()
+            self._start_job('cdrcheck ' + s, run)
+        except Exception, exc:
+            self._report_error(exc)
+
+    def help_jobs(self):
+        print """\
+            jobs
+
+            List the background jobs still running (see emit -b, massemit
+            -b and cdrcheck -b), with the units done and rows written so
+            far. Each job writes the interconnect as it was when the job
+            was started, reading it as it goes where the database allows
+            (for a SQLite file, see use -w) and otherwise straight away. A
+            line is printed when a job finishes, and exit waits for running
+            jobs.
+            """
+    def do_jobs(self, s):
+        for job in self.jobs:
+            if job.running:
+                print '[%d] %s %s (%.1fs, %s)' % (job.num, job.state,
+                        job.description, job.elapsed, job.progress)
 
     def help_bind(self):
         print """\
-            bind <db-uri>
+            bind <db-uri> [<alias>]
 
             Bind to an interconnect database specified by it's
-            SQLAlchemy URI.
+            SQLAlchemy URI, and use it. The database is bound as <alias>,
+            by default the alias in use (or main if nothing is bound yet).
+            Databases bound under other aliases stay open (see use), and
+            connections are kept, so binding a database again is quick.
             """
     def do_bind(self, s):
-        self.ic = sao.Interconnect(s, debug=False)
+        # SQLAlchemy and the mappers are loaded by the first bind rather
+        # than at startup.
+        global sao
+        import saobjects as sao
+
+        args = s.split()
+        if self._required_args(args, self.arg_counts['bind']):
+            return
+        alias = len(args) == 2 and args[1] or self.alias or 'main'
+
+        old_ic = self.ics.get(alias)
+        if old_ic and old_ic.in_batch:
+            old_ic.rollback()
+            print '*** uncommitted batch rolled back'
+        self.ic = self.ics[alias] = sao.Interconnect(args[0], debug=False,
+                attach=self.profiler.attach)
+        self.alias = alias
+        self.profiler.attach(self.ic.engine)
+        self._set_prompt()
+
+    def help_use(self):
+        print """\
+            use [-w] [<alias>]
+
+            Switch to the database bound as <alias>. An open batch stays
+            open on the database it was begun on. Without an alias, list
+            the bound databases, marking the one in use with *. With -w,
+            switch the SQLite file in use to write-ahead logging, so that
+            background jobs (see jobs) read it as they go. This lasts for
+            the file, which older tools may not be able to open.
+            """
+    def do_use(self, s):
+        try:
+            opts, args = getopt.getopt(s.split(), 'w')
+        except getopt.GetoptError, exc:
+            self._report_error(exc)
+            return
+
+        if self._required_args(args, [0, 1]):
+            return
+
+        if not args and not opts:
+            for alias, ic in sorted(self.ics.items()):
+                print '%s %-10s %s%s' % (alias == self.alias and '*' or ' ',
+                        alias, ic.engine.url,
+                        ic.in_batch and ' [batch]' or '')
+            return
+
+        if args:
+            if args[0] not in self.ics:
+                print '*** no database is bound as %s' % args[0]
+                return
+            self.alias = args[0]
+            self.ic = self.ics[self.alias]
+            self._set_prompt()
+
+        try:
+            if opts and not (self.ic and self.ic.use_wal()):
+                print '*** write-ahead logging needs a bound SQLite file'
+        except Exception, exc:
+            self._report_error(exc)
+
+    def complete_use(self, text, line, begidx, endidx):
+        return [alias for alias in sorted(self.ics) if alias.startswith(text)]
+
+    def help_stats(self):
+        print """\
+            stats [reset | json <file>]
+
+            Show the commands which have taken the most time since startup
+            (or the last stats reset), split into time spent in the
+            database and in Python, with the number of SQL statements, rows
+            fetched, rows written and ORM objects loaded, followed by the
+            statements which have taken the most database time. With json,
+            write all of the figures to <file> instead.
+            """
+    def do_stats(self, s):
+        args = s.split()
+
+        if args == ['reset']:
+            self.profiler.reset()
+            return
+
+        try:
+            if args[:1] == ['json'] and len(args) == 2:
+                output_file = file(args[1], 'w')
+                try:
+                    self.profiler.to_json(output_file)
+                finally:
+                    output_file.close()
+                return
+            elif args:
+                raise ValueError('unknown stats option %s' % s)
+        except Exception, exc:
+            self._report_error(exc)
+            return
+
+        t = Tabulator(14, 7, 10, 10, 10, 8, 9, 9, 8)
+        t.write(sys.stdout, [('Command', 'Calls', 'Wall', 'DB', 'Python',
+                    'Stmts', 'Fetched', 'Written', 'Objects')]
+                + [(name, totals['calls'], '%.4f' % totals['wall_time'],
+                    '%.4f' % totals['db_time'],
+                    '%.4f' % (totals['wall_time'] - totals['db_time']),
+                    totals['statements'], totals['rows_fetched'],
+                    totals['rows_written'], totals['objects_loaded'])
+                   for name, totals in self.profiler.hottest_commands()])
+        print
+
+        t = Tabulator(7, 10, 9, 9, 60)
+        t.write(sys.stdout, [('Count', 'DB', 'Fetched', 'Written',
+                    'Statement')]
+                + [(count, '%.4f' % db_time, fetched, written, statement)
+                   for statement, (count, db_time, written, fetched)
+                   in self.profiler.hottest_statements()])
 
     def help_filterunits(self):
         print """\
@@ -121,13 +671,13 @@ class Birdnest(cmd.Cmd):
     def do_ac(self, s):
         args = s.split()
 
-        if self._required_args(args, [6, 7]):
+        if self._required_args(args, self.arg_counts['ac']):
             return
 
         try:
             self.ic.add_cdr(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def complete_ac(self, text, line, begidx, endidx):
         current_args = line.split()[1:]
@@ -140,6 +690,86 @@ class Birdnest(cmd.Cmd):
         elif arg_num == 4:
             return self.ic.complete_conn(current_args[3], text)
 
+    def help_addcable(self):
+        print """\
+            addcable <a-unit> <a-conn> <a-pin-desigs> <b-unit> <b-conn>
+                     <b-pin-desigs> [<kind>]
+
+            Add a new cable with one conductor for each pin in
+            <a-pin-desigs>, running to the corresponding pin in
+            <b-pin-desigs>. Pin lists are comma separated designators and
+            numeric ranges, e.g. 1-37 or A,B,C. Pins are found or created
+            as for ac.
+            """
+    def do_addcable(self, s):
+        args = s.split()
+
+        if self._required_args(args, self.arg_counts['addcable']):
+            return
+
+        try:
+            args[2] = self._desig_list(args[2])
+            args[5] = self._desig_list(args[5])
+            self.ic.add_cable(*args)
+        except Exception, exc:
+            self._report_error(exc)
+
+    def complete_addcable(self, text, line, begidx, endidx):
+        return self.complete_ac(text, line, begidx, endidx)
+
+    def help_import(self):
+        print """\
+            import <file>
+
+            Add the conductors listed in <file>, one per line as comma or
+            tab separated <a-unit> <a-conn> <a-pin-desig> <b-unit> <b-conn>
+            <b-pin-desig> [<cable> [<kind>]]. Pins and nets are found or
+            created as for ac. Blank lines and lines starting with # are
+            ignored. The whole file is added in one transaction.
+            """
+    def do_import(self, s):
+        args = s.split()
+
+        if self._required_args(args, self.arg_counts['import']):
+            return
+
+        try:
+            import_file = file(args[0], 'rb')
+            try:
+                lines = [line for line in import_file
+                         if line.strip() and not line.startswith('#')]
+            finally:
+                import_file.close()
+
+            dialect = 'excel-tab' if lines and '\t' in lines[0] else 'excel'
+            self.ic.import_cdrs(csv.reader(lines, dialect))
+        except Exception, exc:
+            self._report_error(exc)
+
+    def help_trace(self):
+        print """\
+            trace <unit> <conn> <pin-desig> [<unit> <conn> <pin-desig>]
+
+            List every pin that shares a signal with the given pin, across
+            as many conductors as it takes, with the number of conductors
+            (hops) between each net and the given pin and the conductor
+            each net is reached by. If a second pin is given, only the
+            shortest path of conductors between the two pins is listed.
+            """
+    def do_trace(self, s):
+        args = s.split()
+
+        if self._required_args(args, self.arg_counts['trace']):
+            return
+
+        try:
+            self.ic.trace(sys.stdout, *args[:3], to_end=args[3:])
+        except Exception, exc:
+            self._report_error(exc)
+
+    def complete_trace(self, text, line, begidx, endidx):
+        return self.complete_ac(text, line, begidx, endidx)
+
     def help_ap(self):
         print """\
             ap <unit> <conn> <pin-desig> <net-num>
@@ -151,14 +781,14 @@ class Birdnest(cmd.Cmd):
     def do_ap(self, s):
         args = s.split()
 
-        if self._required_args(args, [4]):
+        if self._required_args(args, self.arg_counts['ap']):
             return
 
         try:
             args[3] = int(args[3])
             self.ic.add_pin(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def complete_ap(self, text, line, begidx, endidx):
         current_args = line.split()[1:]
@@ -178,7 +808,7 @@ class Birdnest(cmd.Cmd):
     def do_rmcdr(self, s):
         args = s.split()
 
-        if self._required_args(args, [2]):
+        if self._required_args(args, self.arg_counts['rmcdr']):
             return
 
         try:
@@ -186,23 +816,27 @@ class Birdnest(cmd.Cmd):
                 args[i] = int(args[i])
             self.ic.del_cdr(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def help_descp(self):
         print """\
-            descp <pin-cid> <sig-desc...>
+            descp <pin-cids> <sig-desc...>
 
-            Alter the signal description to <sig-desc...> for the pin
-            designated by <pin-cid>.
+            Alter the signal description to <sig-desc...> for the pins
+            designated by <pin-cids>, either a single PCID or a list of PCIDs
+            and PCID ranges such as 10-40 or 3,5,7-9.
             """
     def do_descp(self, s):
         args = s.split(None, 1)
 
-        if self._required_args(args, [2]):
+        if self._required_args(args, self.arg_counts['descp']):
             return
 
-        args[0] = int(args[0])
-        self.ic.desc_pin(*args)
+        try:
+            args[0] = self._pcid_list(args[0])
+            self.ic.desc_pins(*args)
+        except Exception, exc:
+            self._report_error(exc)
 
     def help_rmnet(self):
         print """\
@@ -214,14 +848,14 @@ class Birdnest(cmd.Cmd):
     def do_rmnet(self, s):
         args = s.split()
 
-        if self._required_args(args, [2]):
+        if self._required_args(args, self.arg_counts['rmnet']):
             return
 
         try:
             args[1] = int(args[1])
             self.ic.del_net(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def complete_rmnet(self, text, line, begidx, endidx):
         current_args = line.split()[1:]
@@ -230,21 +864,61 @@ class Birdnest(cmd.Cmd):
         if arg_num == 0:
             return self.ic.complete_unit(text)
 
+    def help_rmcable(self):
+        print """\
+            rmcable <cable>
+
+            Deletes every conductor in cable <cable>. The pins and nets the
+            conductors were linked to are kept.
+            """
+    def do_rmcable(self, s):
+        args = s.split()
+
+        if self._required_args(args, self.arg_counts['rmcable']):
+            return
+
+        try:
+            self.ic.del_cable(int(args[0]))
+        except Exception, exc:
+            self._report_error(exc)
+
+    def help_rmunit(self):
+        print """\
+            rmunit <unit>
+
+            Deletes unit <unit>: all of its nets and pins, and every
+            conductor linked to them. The remaining conductors of the
+            cables involved have their subconductor IDs closed up.
+            """
+    def do_rmunit(self, s):
+        args = s.split()
+
+        if self._required_args(args, self.arg_counts['rmunit']):
+            return
+
+        try:
+            self.ic.del_unit(args[0])
+        except Exception, exc:
+            self._report_error(exc)
+
+    def complete_rmunit(self, text, line, begidx, endidx):
+        return self.complete_rmnet(text, line, begidx, endidx)
+
     def help_rmpin(self):
         print """\
-            rmpin <pin-cid>
+            rmpin <pin-cids>
 
-            Deletes the pin designated by <pin-cid>. If this pin is the
-            only member of it's net, the net will become inaccessibly
-            orphaned (use rmnet instead).
+            Deletes the pins designated by <pin-cids> (a PCID or a list of
+            PCIDs and ranges, as for descp). If a pin is the only member of
+            it's net, the net will become inaccessibly orphaned (use rmnet
+            instead).
             """
     def do_rmpin(self, s):
         try:
-            arg = int(s)
-            self.ic.del_pin(arg)
+            arg = self._pcid_list(s)
+            self.ic.del_pins(arg)
         except Exception, exc:
-
-            print '***', exc
+            self._report_error(exc)
 
     def help_chpin(self):
         print """\
@@ -256,30 +930,31 @@ class Birdnest(cmd.Cmd):
     def do_chpin(self, s):
         args = s.split()
 
-        if self._required_args(args, [3]):
+        if self._required_args(args, self.arg_counts['chpin']):
             return
 
         try:
             args[0] = int(args[0])
             self.ic.rename_pin(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def help_renumbernets(self):
         print """\
-            renumbernets <unit>
+            renumbernets <unit>|*
 
             Renumbers the nets attached to unit <unit> to better group
             connectors together and to try to order the pins
-            numerically/alphabetically.
+            numerically/alphabetically. With * every unit is renumbered in
+            a single transaction.
             """
     def do_renumbernets(self, s):
         args = s.split()
 
-        if self._required_args(args, [1]):
+        if self._required_args(args, self.arg_counts['renumbernets']):
             return
 
-        self.ic.renumber_nets(args[0])
+        self.ic.renumber_nets(None if args[0] == '*' else args[0])
 
     def complete_renumbernets(self, text, line, begidx, endidx):
         current_args = line.split()[1:]
@@ -303,7 +978,7 @@ class Birdnest(cmd.Cmd):
     def do_setsub(self, s):
         args = s.split()
 
-        if self._required_args(args, [3]):
+        if self._required_args(args, self.arg_counts['setsub']):
             return
 
         try:
@@ -315,7 +990,7 @@ class Birdnest(cmd.Cmd):
 
             self.ic.set_cdr_sub(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
     def help_setkind(self):
         print """\
@@ -329,7 +1004,7 @@ class Birdnest(cmd.Cmd):
     def do_setkind(self, s):
         args = s.split()
 
-        if self._required_args(args, [3]):
+        if self._required_args(args, self.arg_counts['setkind']):
             return
 
         try:
@@ -338,9 +1013,17 @@ class Birdnest(cmd.Cmd):
 
             self.ic.set_cdr_kind(*args)
         except Exception, exc:
-            print '***', exc
+            self._report_error(exc)
 
 
 if __name__ == '__main__':
     bncl = Birdnest()
-    bncl.cmdloop()
+    if sys.argv[1:2] == ['run']:
+        if len(sys.argv) != 3:
+            print 'usage: %s run <script>' % sys.argv[0]
+            sys.exit(2)
+        applied = bncl.run_script(sys.argv[2])
+        bncl._reap_jobs(wait=True)
+        sys.exit(not applied)
+    else:
+        bncl.cmdloop()
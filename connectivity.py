@@ -0,0 +1,147 @@
+import collections
+
+class ConnectivityGraph(object):
+    # Nets joined by conductors. A union-find over the nets answers which
+    # signal a net is on, and an adjacency map of conductors gives paths.
+    # Nets are (unit, num) tuples and conductors (cable, subcdr) tuples.
+    def __init__(self):
+        self._parent = {}
+        self._members = {}
+        self._links = {}
+        self._pins = {}
+        self._pin_nets = {}
+        self._cdrs = {}
+
+    def add_net(self, net):
+        if net not in self._parent:
+            self._parent[net] = net
+            self._members[net] = [net]
+            self._links[net] = {}
+            self._pins[net] = set()
+
+    def add_pin(self, net, conn, desig):
+        self.add_net(net)
+        self._pins[net].add((conn, desig))
+        self._pin_nets.setdefault((net[0], conn, desig), set()).add(net)
+
+    def remove_pin(self, net, conn, desig):
+        if net in self._pins:
+            self._pins[net].discard((conn, desig))
+        nets = self._pin_nets.get((net[0], conn, desig))
+        if nets:
+            nets.discard(net)
+            if not nets:
+                del self._pin_nets[(net[0], conn, desig)]
+
+    def add_cdr(self, cdr, a_net, b_net, kind='C'):
+        self.add_net(a_net)
+        self.add_net(b_net)
+        self._cdrs[cdr] = (a_net, b_net, kind)
+        self._links[a_net][cdr] = b_net
+        self._links[b_net][cdr] = a_net
+
+        a_root, b_root = self.signal(a_net), self.signal(b_net)
+        if a_root != b_root:
+            if len(self._members[a_root]) < len(self._members[b_root]):
+                a_root, b_root = b_root, a_root
+            self._parent[b_root] = a_root
+            self._members[a_root].extend(self._members.pop(b_root))
+
+    def remove_cdr(self, cdr):
+        # Union-find cannot split a set, so when the conductor was the only
+        # link between its ends the signal's nets are walked and regrouped.
+        if cdr not in self._cdrs:
+            return
+        a_net, b_net, _ = self._cdrs.pop(cdr)
+        del self._links[a_net][cdr]
+        self._links[b_net].pop(cdr, None)
+
+        a_side = self._reach(a_net)
+        if b_net in a_side:
+            return
+
+        del self._members[self.signal(a_net)]
+        b_side = self._reach(b_net)
+        for root, side in [(a_net, a_side), (b_net, b_side)]:
+            for net in side:
+                self._parent[net] = root
+            self._members[root] = list(side)
+
+    def cdr_kind(self, cdr):
+        return self._cdrs[cdr][2]
+
+    def pin_net(self, unit, conn, desig):
+        # A designator can be on more than one net of its unit; the lowest
+        # numbered is used.
+        nets = self._pin_nets.get((unit, conn, desig))
+        return nets and min(nets) or None
+
+    def signal(self, net):
+        parent = self._parent
+        while parent[net] != net:
+            parent[net] = parent[parent[net]]
+            net = parent[net]
+        return net
+
+    def connected(self, a_net, b_net):
+        return self.signal(a_net) == self.signal(b_net)
+
+    def signal_nets(self, net):
+        return sorted(self._members[self.signal(net)])
+
+    def signal_pins(self, net):
+        return sorted((member[0], conn, desig)
+                      for member in self._members[self.signal(net)]
+                      for conn, desig in self._pins[member])
+
+    def net_pins(self, net):
+        return sorted(self._pins[net])
+
+    def spanning_tree(self, net):
+        # Breadth-first walk of net's signal, as (net, hops, cdr, from_net)
+        # with the conductor each net was first reached by.
+        tree = [(net, 0, None, None)]
+        hops = {net: 0}
+        queue = collections.deque([net])
+        while queue:
+            from_net = queue.popleft()
+            for cdr, far_net in sorted(self._links[from_net].items()):
+                if far_net not in hops:
+                    hops[far_net] = hops[from_net] + 1
+                    tree.append((far_net, hops[far_net], cdr, from_net))
+                    queue.append(far_net)
+        return tree
+
+    def path(self, a_net, b_net):
+        # Shortest chain of conductors from a_net to b_net, as (cdr, net)
+        # steps, or None if they are not on the same signal.
+        if not self.connected(a_net, b_net):
+            return None
+
+        reached_by = {a_net: None}
+        queue = collections.deque([a_net])
+        while b_net not in reached_by:
+            from_net = queue.popleft()
+            for cdr, far_net in sorted(self._links[from_net].items()):
+                if far_net not in reached_by:
+                    reached_by[far_net] = (cdr, from_net)
+                    queue.append(far_net)
+
+        steps = []
+        net = b_net
+        while reached_by[net]:
+            cdr, from_net = reached_by[net]
+            steps.append((cdr, net))
+            net = from_net
+        steps.reverse()
+        return steps
+
+    def _reach(self, net):
+        reached = set([net])
+        stack = [net]
+        while stack:
+            for far_net in self._links[stack.pop()].values():
+                if far_net not in reached:
+                    reached.add(far_net)
+                    stack.append(far_net)
+        return reached
@@ -0,0 +1,96 @@
+import threading, time
+
+class CountingFile(object):
+    # Passes writes on to a job's output file, counting the lines written
+    # and, if the file holds a unit, the unit once it is closed.
+    def __init__(self, file, job, unit=False):
+        self._file = file
+        self._job = job
+        self._unit = unit
+
+    def write(self, s):
+        self._file.write(s)
+        self._job.advance(rows=s.count('\n'))
+
+    def close(self):
+        self._file.close()
+        if self._unit:
+            self._job.advance(units=1)
+
+class Job(object):
+    # A report written by a worker thread, from the rows as they were when
+    # the job was started, while the command line carries on. run(job) does
+    # the writing, through files wrapped by counted(), sets units if it
+    # knows them, and may return a line to report once it has finished.
+    # start() returns once run has called snapshot_taken(), or finished.
+    # The thread is not a daemon, so the interpreter waits for running jobs
+    # before exiting.
+    def __init__(self, num, description, run):
+        self.num = num
+        self.description = description
+        self.units = None
+        self.units_done = 0
+        self.rows_written = 0
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._run = run
+        self._lock = threading.Lock()
+        self._snapshot_taken = threading.Event()
+        self._thread = threading.Thread(target=self._work,
+                name='job %d' % num)
+
+    def start(self):
+        self.started = time.time()
+        self._thread.start()
+        self._snapshot_taken.wait()
+
+    def wait(self):
+        self._thread.join()
+
+    def _work(self):
+        try:
+            self.result = self._run(self)
+        except Exception, exc:
+            self.error = exc
+        self.finished = time.time()
+        self._snapshot_taken.set()
+
+    def snapshot_taken(self):
+        self._snapshot_taken.set()
+
+    def counted(self, file, unit=False):
+        return CountingFile(file, self, unit)
+
+    def unit_done(self):
+        self.advance(units=1)
+
+    def advance(self, units=0, rows=0):
+        self._lock.acquire()
+        try:
+            self.units_done += units
+            self.rows_written += rows
+        finally:
+            self._lock.release()
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    @property
+    def state(self):
+        if self.running:
+            return 'running'
+        return self.error and 'failed' or 'done'
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def progress(self):
+        if self.units is None:
+            return '%d rows' % self.rows_written
+        return '%d/%d units, %d rows' % (self.units_done, self.units,
+                self.rows_written)
@@ -0,0 +1,19 @@
+import bisect
+
+class PrefixIndex(object):
+    # Sorted word list answering prefix queries by bisection. Matching
+    # ignores case, like LIKE 'prefix%' does on SQLite.
+    def __init__(self, words):
+        self._keys = sorted(set((word.lower(), word) for word in words))
+
+    def __call__(self, prefix):
+        prefix = prefix.lower()
+        matches = []
+        index = bisect.bisect_left(self._keys, (prefix,))
+        while index < len(self._keys):
+            key, word = self._keys[index]
+            if not key.startswith(prefix):
+                break
+            matches.append(word)
+            index += 1
+        return sorted(matches)
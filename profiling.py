@@ -0,0 +1,137 @@
+import json, re, threading, time
+
+COUNTERS = ['calls', 'wall_time', 'db_time', 'statements', 'rows_fetched',
+        'rows_written', 'objects_loaded']
+
+class Profiler(object):
+    # Per-command and per-statement accounting, fed by the engine's cursor
+    # events, the results of its statements and the ORM load event. Commands
+    # can nest (a script and the commands in it), and a statement counts
+    # towards every open command. Only the thread which made the profiler is
+    # counted, not background jobs. SQLAlchemy is only imported once an
+    # engine is attached.
+    def __init__(self):
+        self._thread = threading.current_thread()
+        self.reset()
+        self._frames = []
+        self._stmt_start = None
+        self._engines = []
+        self._counting_loads = False
+
+    def reset(self):
+        self._commands = {}
+        self._statements = {}
+
+    def attach(self, engine):
+        from sqlalchemy import event, orm
+
+        if engine not in self._engines:
+            event.listen(engine, 'before_cursor_execute',
+                    self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+            engine.dialect.execution_ctx_cls = self._counting_context(
+                    engine.dialect.execution_ctx_cls)
+            self._engines.append(engine)
+        if not self._counting_loads:
+            event.listen(orm.mapper, 'load', self._loaded)
+            self._counting_loads = True
+
+    def _counting_context(self, context_cls):
+        # An execution context whose results count the rows fetched from
+        # them, which the cursor events do not see.
+        profiler = self
+
+        class CountingContext(context_cls):
+            def get_result_proxy(self):
+                result = context_cls.get_result_proxy(self)
+                process_rows = result.process_rows
+                statement = self.statement
+                def counted_rows(rows):
+                    rows = process_rows(rows)
+                    profiler._fetched(statement, len(rows))
+                    return rows
+                result.process_rows = counted_rows
+                return result
+
+        return CountingContext
+
+    def begin(self, name):
+        self._frames.append((name, time.time(), dict.fromkeys(COUNTERS, 0)))
+
+    def end(self):
+        name, start, frame = self._frames.pop()
+        frame['calls'] = 1
+        frame['wall_time'] = time.time() - start
+
+        totals = self._commands.setdefault(name, dict.fromkeys(COUNTERS, 0))
+        for counter in COUNTERS:
+            totals[counter] += frame[counter]
+
+    def _count(self, counter, value):
+        for _, _, frame in self._frames:
+            frame[counter] += value
+
+    def _elsewhere(self):
+        return threading.current_thread() is not self._thread
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+            executemany):
+        if self._elsewhere():
+            return
+        self._stmt_start = time.time()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+            executemany):
+        if self._elsewhere():
+            return
+        elapsed = time.time() - (self._stmt_start or time.time())
+        # A SELECT's rowcount is the rows it returned on some drivers.
+        rows = 0
+        if context is not None and (context.isinsert or context.isupdate
+                or context.isdelete):
+            rows = max(cursor.rowcount, 0)
+
+        totals = self._statement_totals(statement)
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] += rows
+
+        self._count('statements', 1)
+        self._count('db_time', elapsed)
+        self._count('rows_written', rows)
+
+    def _fetched(self, statement, rows):
+        if self._elsewhere():
+            return
+        self._statement_totals(statement)[3] += rows
+        self._count('rows_fetched', rows)
+
+    def _statement_totals(self, statement):
+        statement = re.sub(r'\s+', ' ', statement).strip()
+        return self._statements.setdefault(statement, [0, 0.0, 0, 0])
+
+    def _loaded(self, instance, context):
+        if self._elsewhere():
+            return
+        self._count('objects_loaded', 1)
+
+    def hottest_commands(self, limit=10):
+        return sorted(self._commands.items(),
+                key=lambda (name, totals): -totals['wall_time'])[:limit]
+
+    def hottest_statements(self, limit=10):
+        return sorted(self._statements.items(),
+                key=lambda (statement, totals): -totals[1])[:limit]
+
+    def to_json(self, file):
+        commands = {}
+        for name, totals in self._commands.items():
+            commands[name] = dict(totals,
+                    python_time=totals['wall_time'] - totals['db_time'])
+        statements = [{'statement': statement, 'count': count,
+                       'db_time': db_time, 'rows_written': written,
+                       'rows_fetched': fetched}
+                      for statement, (count, db_time, written, fetched)
+                      in self.hottest_statements(len(self._statements))]
+        json.dump({'commands': commands, 'statements': statements}, file,
+                indent=2, sort_keys=True)
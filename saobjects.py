@@ -1,52 +1,208 @@
+import collections
+import copy
+import itertools
+import re
+import textwrap
+
 import sqlalchemy as sa
 from sqlalchemy import orm
+from sqlalchemy.engine import reflection
 
 from sqlalchemy.sql import and_, or_
 from sqlalchemy.types import Integer, String
 from sqlalchemy.schema import Column, ForeignKey, ForeignKeyConstraint
 
 from tabulator import Tabulator
+from prefixindex import PrefixIndex
+from connectivity import ConnectivityGraph
 
 meta = sa.MetaData()
 
+_engines = {}
+
 def init_echo_session(dburi):
-    init_and_bind_engine(dburi)
-    meta.bind.echo = True
-    ses = orm.create_session()
+    engine = engine_for(dburi)
+    engine.echo = True
+    ses = orm.create_session(bind=engine)
     ses.echo_uow = True
     return ses
 
-def init_and_bind_engine(dburi):
-    engine = sa.create_engine(dburi)
-    meta.bind = engine
-    meta.create_all()
+def engine_for(dburi, attach=None):
+    # Engines are kept per URI, except private in-memory SQLite ones.
+    engine = _engines.get(dburi)
+    if engine is None:
+        engine = sa.create_engine(dburi)
+        if attach:
+            attach(engine)
+        init_schema(engine)
+        if not in_memory(engine):
+            _engines[dburi] = engine
+    return engine
+
+def in_memory(engine):
+    url = engine.url
+    return url.drivername.startswith('sqlite') \
+            and url.database in (None, '', ':memory:')
+
+def init_schema(engine):
+    # Databases already at SCHEMA_VERSION skip create_all().
+    if (stored_schema_version(engine) or 0) < SCHEMA_VERSION:
+        meta.create_all(engine)
+        upgrade_schema(engine)
+        engine.execute(schema_version_table.delete())
+        engine.execute(schema_version_table.insert(),
+                version=SCHEMA_VERSION)
+
+def stored_schema_version(engine):
+    try:
+        return engine.execute(
+                sa.select([schema_version_table.c.version])).scalar()
+    except sa.exc.DBAPIError:
+        return None
+
+def upgrade_schema(engine):
+    # Adds columns and indexes missing from tables made by older versions.
+    inspector = reflection.Inspector.from_engine(engine)
+    for table in meta.sorted_tables:
+        existing = set(c['name'] for c in inspector.get_columns(table.name))
+        added = [c for c in table.columns if c.name not in existing]
+        for column in added:
+            engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                table.name, column.name,
+                column.type.compile(engine.dialect)))
+
+        if table is pin_table and added:
+            fill_pin_sort_keys(engine)
+
+        existing = set(ix['name'] for ix in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+
+def fill_pin_sort_keys(engine):
+    pin_keys = [dict(pin_sort_keys(r.conn, r.desig), pk_net_unit=r.net_unit,
+                     pk_net_num=r.net_num, pk_conn=r.conn, pk_desig=r.desig)
+                for r in engine.execute(pin_table.select())]
+    if pin_keys:
+        engine.execute(pin_table.update(pin_pk_match), pin_keys)
+
+def chunked(values, size=500):
+    # Keeps IN lists under SQLite's limit on bound parameters.
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+# Bump when meta gains a table, column or index.
+SCHEMA_VERSION = 1
+
+schema_version_table = sa.Table('schema_version', meta,
+        Column('version', Integer, nullable=False))
+
+id_counter_table = sa.Table('id_counters', meta,
+        Column('space', String(20), primary_key=True),
+        Column('scope', String(20), primary_key=True),
+        Column('hwm', Integer, nullable=False))
+
+class IdAllocator(object):
+    # Ascending IDs per scope, from high-water marks kept in id_counters.
+    def __init__(self, space, seed_sel):
+        self._space = space
+        self._seed_sel = seed_sel
+
+    def _match(self, scope):
+        return and_(id_counter_table.c.space == self._space,
+                id_counter_table.c.scope == str(scope))
+
+    def reserve(self, connection, scope, count=1):
+        advanced = connection.execute(id_counter_table.update(
+                self._match(scope),
+                values={id_counter_table.c.hwm:
+                    id_counter_table.c.hwm + count}))
+
+        if advanced.rowcount:
+            hwm = connection.execute(sa.select([id_counter_table.c.hwm],
+                self._match(scope))).scalar()
+        else:
+            hwm = (connection.execute(self._seed_sel(scope)).scalar()
+                    or 0) + count
+            connection.execute(id_counter_table.insert(),
+                    space=self._space, scope=str(scope), hwm=hwm)
+
+        return hwm - count + 1
+
+    def advance(self, connection, scope, used_id):
+        self.reserve(connection, scope, 0)
+        connection.execute(id_counter_table.update(
+                and_(self._match(scope), id_counter_table.c.hwm < used_id),
+                values={id_counter_table.c.hwm: used_id}))
+
+    def tracked(self, connection, scopes):
+        # The scopes that already have a high-water mark.
+        tracked = set()
+        for scopes_chunk in chunked(scopes):
+            tracked.update(r[0] for r in connection.execute(sa.select(
+                    [id_counter_table.c.scope],
+                    and_(id_counter_table.c.space == self._space,
+                        id_counter_table.c.scope.in_(
+                            [str(scope) for scope in scopes_chunk])))))
+        return tracked
+
+    def reset(self, connection, scopes):
+        # Scopes whose IDs were rewritten are seeded again on next use.
+        for scopes_chunk in chunked(scopes):
+            connection.execute(id_counter_table.delete(and_(
+                    id_counter_table.c.space == self._space,
+                    id_counter_table.c.scope.in_(
+                        [str(scope) for scope in scopes_chunk]))))
+
+change_journal_table = sa.Table('change_journal', meta,
+        Column('seq', Integer, primary_key=True),
+        Column('unit', String(20)))
+
+def journal_units(connection, units):
+    # A unit of None stands for every unit.
+    if units is None:
+        units = [None]
+    if units:
+        connection.execute(change_journal_table.insert(),
+                [{'unit': unit} for unit in set(units)])
 
 net_table = sa.Table('nets', meta,
         Column('unit', String(20), primary_key=True),
         Column('num', Integer, primary_key=True),
         Column('sig_desc', String(50)))
 
+net_num_allocator = IdAllocator('net', lambda unit: sa.select(
+        [sa.func.max(net_table.c.num)], net_table.c.unit == unit))
+
+PinEnd = collections.namedtuple('PinEnd', 'net_unit conn desig')
+
+def net_label(unit, num):
+    return "N-%s.%s" % (unit, num)
+
+def cdr_label(cable, subcdr, kind):
+    if subcdr and kind == 'C':
+        return "C-%s.%s" % (cable, subcdr)
+    elif subcdr:
+        return "C-%s.%s (%s)" % (cable, subcdr, kind)
+    elif kind == 'C':
+        return "C-%s" % (cable)
+    else:
+        return "C-%s (%s)" % (cable, kind)
+
 class Net(object):
     def __init__(self, unit, sig_desc=None):
         self.unit = unit
         self.sig_desc = sig_desc
 
     def __str__(self):
-        return "N-%s.%s" % (self.unit, self.num)
+        return net_label(self.unit, self.num)
     def __repr__(self):
         return "<net %s>" % str(self)
 
 class NetMapperExtension(orm.MapperExtension):
     def before_insert(self, mapper, connection, instance):
-        num_sel = sa.select(
-                [sa.func.max(net_table.c.num).label('max')],
-                net_table.c.unit == instance.unit)
-        instance.num = num_sel.execute().fetchone().max or 0
-        instance.num += 1
-
-    def before_delete(self, mapper, connection, instance):
-        cdr_mapper = orm.class_mapper(Conductor)
-        [ cdr_mapper.delete_obj(cdr) for cdr in instance.linked_cdrs ]
+        instance.num = net_num_allocator.reserve(connection, instance.unit)
+        journal_units(connection, [instance.unit])
 
 conductor_table = sa.Table('conductors', meta,
         Column('a_net_unit', String(20), nullable=False),
@@ -71,41 +227,34 @@ class Conductor(object):
         self.cable = cable
 
     def __str__(self):
-        if self.subcdr and self.kind == 'C':
-            return "C-%s.%s" % (self.cable, self.subcdr)
-        elif self.subcdr:
-            return "C-%s.%s (%s)" % (self.cable, self.subcdr, self.kind)
-        elif self.kind == 'C':
-            return "C-%s" % (self.cable)
-        else:
-            return "C-%s (%s)" % (self.cable, self.kind)
+        return cdr_label(self.cable, self.subcdr, self.kind)
     def __repr__(self):
         return "<conductor %s>" % str(self)
 
     def swap_orientation(self):
         self.a_net, self.b_net = self.b_net, self.a_net
 
+cable_allocator = IdAllocator('cable', lambda _: sa.select(
+        [sa.func.max(conductor_table.c.cable)]))
+subcdr_allocator = IdAllocator('subcdr', lambda cable: sa.select(
+        [sa.func.max(conductor_table.c.subcdr)],
+        conductor_table.c.cable == cable))
+
 class ConductorMapperExtension(orm.MapperExtension):
     def before_insert(self, mapper, connection, instance):
 
         if instance.cable == None:
-            cable_sel = sa.select(
-                    [sa.func.max(conductor_table.c.cable).label('max')])
-            instance.cable = cable_sel.execute().fetchone().max or 0
-            instance.cable += 1
-
-        subcdr_sel = sa.select(
-                [sa.func.max(conductor_table.c.subcdr).label('max')],
-                conductor_table.c.cable == instance.cable)
-        instance.subcdr = subcdr_sel.execute().fetchone().max or 0
-        instance.subcdr += 1
-
-    def after_delete(self, mapper, connection, instance):
-        conductor_table.update(
-                and_(conductor_table.c.cable==instance.cable,
-                    conductor_table.c.subcdr > instance.subcdr),
-                values={ conductor_table.c.subcdr:
-                    conductor_table.c.subcdr - 1 }).execute()
+            instance.cable = cable_allocator.reserve(connection, '')
+        else:
+            cable_allocator.advance(connection, '', instance.cable)
+
+        instance.subcdr = subcdr_allocator.reserve(connection, instance.cable)
+
+    def after_insert(self, mapper, connection, instance):
+        journal_units(connection,
+                [instance.a_net_unit, instance.b_net_unit])
+
+    after_update = after_insert
 
 pin_table = sa.Table('pins', meta,
         Column('net_unit', String(20), nullable=False,
@@ -115,10 +264,21 @@ pin_table = sa.Table('pins', meta,
         Column('conn', String(20), primary_key=True),
         Column('desig', String(20), primary_key=True),
         Column('sig_desc', String(50)),
+        Column('conn_sort', String(220)),
+        Column('desig_sort', String(220)),
         ForeignKeyConstraint(
             ['net_unit', 'net_num'],
             ['nets.unit', 'nets.num']))
 
+def natural_sort_key(name):
+    # Zero-pads digit runs so that J2 sorts before J12.
+    return re.sub(r'\d+', lambda m: m.group().lstrip('0').rjust(10, '0'),
+                  name)
+
+def pin_sort_keys(conn, desig):
+    return {'conn_sort': natural_sort_key(conn),
+            'desig_sort': natural_sort_key(desig)}
+
 class Pin(object):
     def __init__(self, conn, desig, net=None, sig_desc=None):
         self.net = net
@@ -133,19 +293,40 @@ class Pin(object):
     def __repr__(self):
         return "<pin %s>" % str(self)
 
-net_to_cdr_join = or_(
-    and_(net_table.c.unit == conductor_table.c.a_net_unit,
-        net_table.c.num == conductor_table.c.a_net_num),
-    and_(net_table.c.unit == conductor_table.c.b_net_unit,
-        net_table.c.num == conductor_table.c.b_net_num))
+sa.Index('ix_conductors_a_net',
+        conductor_table.c.a_net_unit, conductor_table.c.a_net_num)
+sa.Index('ix_conductors_b_net',
+        conductor_table.c.b_net_unit, conductor_table.c.b_net_num)
+sa.Index('ix_pins_conn_desig', pin_table.c.conn, pin_table.c.desig)
+sa.Index('ix_pins_natural',
+        pin_table.c.net_unit, pin_table.c.conn_sort, pin_table.c.desig_sort)
+
+# Each conductor seen from both of its nets, so each side uses its index.
+cdr_ends = sa.union_all(
+        sa.select([
+            conductor_table.c.a_net_unit.label('net_unit'),
+            conductor_table.c.a_net_num.label('net_num'),
+            conductor_table.c.b_net_unit.label('far_unit'),
+            conductor_table.c.b_net_num.label('far_num'),
+            conductor_table.c.cable, conductor_table.c.subcdr,
+            conductor_table.c.kind]),
+        sa.select([
+            conductor_table.c.b_net_unit.label('net_unit'),
+            conductor_table.c.b_net_num.label('net_num'),
+            conductor_table.c.a_net_unit.label('far_unit'),
+            conductor_table.c.a_net_num.label('far_num'),
+            conductor_table.c.cable, conductor_table.c.subcdr,
+            conductor_table.c.kind],
+            sa.not_(and_(
+                conductor_table.c.a_net_unit == conductor_table.c.b_net_unit,
+                conductor_table.c.a_net_num == conductor_table.c.b_net_num)))
+        ).alias('cdr_ends')
+
+net_to_cdr_ends_join = and_(
+        net_table.c.unit == cdr_ends.c.net_unit,
+        net_table.c.num == cdr_ends.c.net_num)
 
 orm.mapper(Net, net_table, properties = {
-    'linked_cdrs': orm.relation(Conductor,
-        primaryjoin = net_to_cdr_join,
-        order_by = [
-            conductor_table.c.cable,
-            conductor_table.c.subcdr ]
-        ),
     'linked_pins': orm.relation(Pin,
         cascade = 'all, delete-orphan',
         backref = orm.backref('net', lazy=False)
@@ -165,175 +346,408 @@ orm.mapper(Conductor, conductor_table, properties = {
         )
     }, extension=ConductorMapperExtension())
 
+# Scratch tables are kept out of meta so create_all() never makes them.
+temp_meta = sa.MetaData()
+
+net_renumber_table = sa.Table('net_renumbering', temp_meta,
+        Column('unit', String(20), primary_key=True),
+        Column('old_num', Integer, primary_key=True),
+        Column('new_num', Integer, nullable=False),
+        prefixes=['TEMPORARY'])
+
+deleted_cdr_table = sa.Table('deleted_cdrs', temp_meta,
+        Column('cable', Integer, primary_key=True),
+        Column('subcdr', Integer, primary_key=True),
+        prefixes=['TEMPORARY'])
+
+unit_rank_table = sa.Table('unit_ranks', temp_meta,
+        Column('unit', String(20), primary_key=True),
+        Column('fan_rank', Integer, nullable=False),
+        prefixes=['TEMPORARY'])
+
 pin_to_net_join = and_(
         pin_table.c.net_unit == net_table.c.unit,
         pin_table.c.net_num == net_table.c.num)
 
-orm.mapper(Pin, pin_table)
+pin_pk_match = and_(
+        pin_table.c.net_unit == sa.bindparam('pk_net_unit'),
+        pin_table.c.net_num == sa.bindparam('pk_net_num'),
+        pin_table.c.conn == sa.bindparam('pk_conn'),
+        pin_table.c.desig == sa.bindparam('pk_desig'))
+
+class PinMapperExtension(orm.MapperExtension):
+    def before_insert(self, mapper, connection, instance):
+        instance.conn_sort = natural_sort_key(instance.conn)
+        instance.desig_sort = natural_sort_key(instance.desig)
+
+    before_update = before_insert
+
+    def after_insert(self, mapper, connection, instance):
+        journal_units(connection, [instance.net_unit])
+
+    after_update = after_insert
+    after_delete = after_insert
+
+orm.mapper(Pin, pin_table, extension=PinMapperExtension())
 
 
 class Interconnect(object):
 
-    def __init__(self, dburi='sqlite://', debug=True):
-        init_and_bind_engine(dburi)
+    def __init__(self, dburi='sqlite://', debug=True, attach=None):
+        self.engine = engine_for(dburi, attach)
         self._debug = debug
         self._ses = None
+        self._batch_conn = None
+        self._batch_trans = None
+        self._read_conn = None
         self._filter_units = None
         self._link_filter = False
+        self._pcid_keys = None
+        self._completions = None
+        self._graph = None
+        self._sections = {}
+        self._generation = 0
+        self._unit_generations = {}
 
         if debug:
-            meta.bind.echo = True
+            self.engine.echo = True
 
     def _get_ses(self):
         if not self._ses:
-            self._ses = orm.create_session()
+            self._ses = orm.create_session(bind=self.engine)
             self._ses.echo_uow = self._debug
         return self._ses
 
     def _close_ses(self):
-        if self._ses:
+        if self._ses and not self.in_batch:
             self._ses.close()
             self._ses = None
 
-    def _pin_table_query(self):
-        s = self._get_ses()
+    def _flush(self):
+        # Inside a batch, flushes are left to autoflush and the commit.
+        if not self.in_batch:
+            self._get_ses().flush()
+
+    def _connect(self):
+        # Core statements in a batch see the session's pending changes.
+        if self.in_batch:
+            self._ses.flush()
+            self._ses.expunge_all()
+            return self._batch_conn
+        return self.engine.connect()
+
+    def _disconnect(self, conn):
+        if conn is not self._batch_conn:
+            conn.close()
 
-        pt_q = s.query(Pin).add_entity(Net).outerjoin('net')
+    def _execute(self, stmt, *multiparams):
+        if self._read_conn is not None:
+            return self._read_conn.execute(stmt, *multiparams)
+        if self.in_batch:
+            self._ses.flush()
+            return self._batch_conn.execute(stmt, *multiparams)
+        return self.engine.execute(stmt, *multiparams)
+
+    def _create_scratch(self, conn, table):
+        # Created outside the transaction, which would commit it on SQLite.
+        if self.in_batch:
+            conn.execute(table.delete())
+        else:
+            table.create(conn)
 
-        if self._link_filter:
-            pt_q = pt_q.outerjoin('net', 'linked_cdrs').filter(
-                    and_(conductor_table.c.a_net_unit.in_(self._filter_units),
-                        conductor_table.c.b_net_unit.in_(self._filter_units)))
+    def _drop_scratch(self, conn, table):
+        if not self.in_batch:
+            table.drop(conn)
 
-        elif self._filter_units:
-            pt_q = pt_q.filter(
-                    net_table.c.unit.in_(self._filter_units))
+    @property
+    def in_batch(self):
+        return self._batch_conn is not None
 
-        pt_q = pt_q.order_by(net_table.c.unit, net_table.c.num,
-                pin_table.c.conn, pin_table.c.desig)
+    def begin(self):
+        if self.in_batch:
+            raise RuntimeError('A batch is already open.')
 
-        return pt_q
+        self._close_ses()
+        conn = self.engine.connect()
+        try:
+            for table in temp_meta.sorted_tables:
+                table.create(conn)
+            self._batch_trans = conn.begin()
+        except:
+            conn.close()
+            raise
 
-    def _cdr_table_query(self):
-        s = self._get_ses()
+        self._batch_conn = conn
+        self._ses = orm.create_session(bind=conn, autoflush=True)
+        self._ses.echo_uow = self._debug
 
-        a_pins = orm.aliased(Pin)
-        b_pins = orm.aliased(Pin)
-        ct_q = s.query(Conductor, a_pins, b_pins).filter(
-                a_pins.net_unit==Conductor.a_net_unit,
-                a_pins.net_num==Conductor.a_net_num,
-                b_pins.net_unit==Conductor.b_net_unit,
-                b_pins.net_num==Conductor.b_net_num)
+    def commit(self):
+        if not self.in_batch:
+            raise RuntimeError('No batch is open.')
 
-        if self._filter_units:
-            oper = and_ if self._link_filter else or_
-            ct_q = ct_q.filter(oper(
-                    a_pins.net_unit.in_(self._filter_units),
-                    b_pins.net_unit.in_(self._filter_units)))
+        try:
+            self._ses.flush()
+            self._batch_trans.commit()
+        except:
+            self.rollback()
+            raise
 
-        int_ = lambda exp: sa.cast(exp, sa.Integer)
-        ct_q = ct_q.order_by(
-                a_pins.net_unit, int_(a_pins.conn), a_pins.conn,
-                int_(a_pins.desig), a_pins.desig,
-                b_pins.net_unit, int_(b_pins.conn), b_pins.conn,
-                int_(b_pins.desig), b_pins.desig)
+        self._end_batch()
 
-        return ct_q
+    def rollback(self):
+        if not self.in_batch:
+            raise RuntimeError('No batch is open.')
 
-    @property
-    def unit_display_filter(self):
-        return self._filter_units
-    @unit_display_filter.setter
-    def unit_display_filter(self, value):
-        self._filter_units = value
+        try:
+            if self._batch_trans.is_active:
+                self._batch_trans.rollback()
+        finally:
+            self._end_batch()
+            self._invalidate()
+            self._graph = None
+
+    def end_failed_batch(self):
+        # A failed statement rolls back the whole batch transaction.
+        if self.in_batch and not self._batch_trans.is_active:
+            self.rollback()
+            return True
+        return False
+
+    def _end_batch(self):
+        conn = self._batch_conn
+        self._batch_conn = None
+        self._batch_trans = None
+        self._ses.close()
+        self._ses = None
+        try:
+            for table in temp_meta.sorted_tables:
+                table.drop(conn)
+        finally:
+            conn.close()
 
-    def toggle_link_filter(self):
-        self._link_filter = not self._link_filter
-        return self._link_filter
+    def _invalidate_view(self):
+        self._pcid_keys = None
 
-    def conn_tables(self, file, show_pcids=True):
+    def _invalidate(self, units=None):
+        self._invalidate_view()
+        self._completions = None
+        self._touch(units)
+
+    def _touch(self, units=None):
+        # units of None means every unit.
+        if units is None:
+            self._generation += 1
+            self._sections.clear()
+        else:
+            for unit in units:
+                self._unit_generations[unit] = \
+                        self._unit_generations.get(unit, 0) + 1
+                self._sections.pop(unit, None)
+
+    def _cdr_units(self, conn, match):
+        return set(unit for r in conn.execute(sa.select(
+                    [conductor_table.c.a_net_unit,
+                        conductor_table.c.b_net_unit], match))
+                for unit in r)
+
+    def _pin_report_from(self, per_unit=False, units=None):
+        # per_unit filters each unit as if it were the only one in the filter.
+        pn_j = sa.join(pin_table, net_table, onclause=pin_to_net_join)
+        whereclause = None
 
         if self._link_filter:
-            print "*** Link Filter is ON ***"
+            cdrs = conductor_table.c
+            def linked(near_unit, near_num, far_unit):
+                if per_unit:
+                    far_match = far_unit == net_table.c.unit
+                else:
+                    far_match = far_unit.in_(self._filter_units)
+                return sa.exists([cdrs.cable], and_(
+                        near_unit == net_table.c.unit,
+                        near_num == net_table.c.num, far_match))
+
+            whereclause = or_(
+                    linked(cdrs.a_net_unit, cdrs.a_net_num, cdrs.b_net_unit),
+                    linked(cdrs.b_net_unit, cdrs.b_net_num, cdrs.a_net_unit))
+            if not per_unit:
+                whereclause = and_(
+                    net_table.c.unit.in_(self._filter_units), whereclause)
+
+        elif self._filter_units and not per_unit:
+            whereclause = net_table.c.unit.in_(self._filter_units)
+
+        if units is not None:
+            units_match = net_table.c.unit.in_(units)
+            whereclause = units_match if whereclause is None \
+                    else and_(units_match, whereclause)
+
+        return pn_j, whereclause
+
+    def _pin_keys(self):
+        # PCIDs are positions in the pin table.
+        if self._pcid_keys is None:
+            pn_j, pin_where = self._pin_report_from()
+            keys_q = sa.select(
+                    [pin_table.c.net_unit, pin_table.c.net_num,
+                        pin_table.c.conn, pin_table.c.desig],
+                    whereclause=pin_where,
+                    from_obj=[pn_j],
+                    order_by=[net_table.c.unit, net_table.c.num,
+                        pin_table.c.conn, pin_table.c.desig])
+            self._pcid_keys = [tuple(r) for r in self._execute(keys_q)]
+
+        return self._pcid_keys
+
+    def _pin_keys_for_cids(self, pin_cids):
+        pin_keys = self._pin_keys()
+        for pin_cid in pin_cids:
+            if not 0 <= pin_cid < len(pin_keys):
+                raise IndexError('No pin with PCID %d' % pin_cid)
+        return [dict(zip(['pk_net_unit', 'pk_net_num', 'pk_conn', 'pk_desig'],
+                    pin_keys[pin_cid])) for pin_cid in pin_cids]
 
-        pin_tables_q = self._pin_table_query()
-        pin_tables_result = list(pin_tables_q)
+    def _cdr_table_query(self):
+        cdrs = conductor_table.c
+        a_pins = pin_table.alias('a_pins').c
+        b_pins = pin_table.alias('b_pins').c
+        ct_q = sa.select([cdrs.cable, cdrs.subcdr, cdrs.kind,
+                    a_pins.net_unit, a_pins.conn, a_pins.desig,
+                    b_pins.net_unit, b_pins.conn, b_pins.desig],
+                and_(a_pins.net_unit == cdrs.a_net_unit,
+                    a_pins.net_num == cdrs.a_net_num,
+                    b_pins.net_unit == cdrs.b_net_unit,
+                    b_pins.net_num == cdrs.b_net_num))
+
+        if self._filter_units:
+            oper = and_ if self._link_filter else or_
+            ct_q = ct_q.where(oper(
+                    a_pins.net_unit.in_(self._filter_units),
+                    b_pins.net_unit.in_(self._filter_units)))
 
-        output_lines = ['Unit Net Conn Pin Signal Cdrs Ref Net PCID'.split()]
+        ct_q = ct_q.order_by(
+                a_pins.net_unit, a_pins.conn_sort, a_pins.conn,
+                a_pins.desig_sort, a_pins.desig,
+                b_pins.net_unit, b_pins.conn_sort, b_pins.conn,
+                b_pins.desig_sort, b_pins.desig)
+
+        return ct_q.execution_options(stream_results=True)
+
+    def _cdr_table_rows(self):
+        for (cable, subcdr, kind, a_unit, a_conn, a_desig,
+                b_unit, b_conn, b_desig) in self._execute(
+                    self._cdr_table_query()):
+            yield (cdr_label(cable, subcdr, kind),
+                    PinEnd(a_unit, a_conn, a_desig),
+                    PinEnd(b_unit, b_conn, b_desig))
+
+    def _conn_report_query(self, per_unit=False, units=None):
+        # Pins and conductor ends stream in net order, one net held at a time.
+        pn_j, pin_where = self._pin_report_from(per_unit, units)
+
+        null = lambda label, type_: sa.cast(sa.null(), type_).label(label)
+        pins_q = sa.select(
+                [net_table.c.unit.label('unit'),
+                    net_table.c.num.label('num'),
+                    sa.literal_column('0').label('row_type'),
+                    pin_table.c.conn.label('conn'),
+                    pin_table.c.desig.label('desig'),
+                    pin_table.c.sig_desc.label('sig_desc'),
+                    null('cable', Integer), null('subcdr', Integer),
+                    null('kind', String), null('ref_unit', String),
+                    null('ref_num', Integer)],
+                whereclause=pin_where,
+                from_obj=[pn_j])
+
+        ends_q = sa.select(
+                [cdr_ends.c.net_unit.label('unit'),
+                    cdr_ends.c.net_num.label('num'),
+                    sa.literal_column('1').label('row_type'),
+                    null('conn', String), null('desig', String),
+                    null('sig_desc', String),
+                    cdr_ends.c.cable.label('cable'),
+                    cdr_ends.c.subcdr.label('subcdr'),
+                    cdr_ends.c.kind.label('kind'),
+                    cdr_ends.c.far_unit.label('ref_unit'),
+                    cdr_ends.c.far_num.label('ref_num')])
+        if self._filter_units and not per_unit:
+            ends_q = ends_q.where(
+                    cdr_ends.c.net_unit.in_(self._filter_units))
+        if units is not None:
+            ends_q = ends_q.where(cdr_ends.c.net_unit.in_(units))
+
+        return sa.union_all(pins_q, ends_q).order_by(
+                'unit', 'num', 'row_type', 'conn', 'desig',
+                'cable', 'subcdr').execution_options(stream_results=True)
+
+    def _conn_table_lines(self, report_rows, pcid_keys=None):
+        yield 'Unit Net Conn Pin Signal Cdrs Ref Net PCID'.split()
 
         prev_output_line = [None] * 7
         pcid = 0
-        for index in range(len(pin_tables_result)):
-            cur_pin, cur_net = pin_tables_result[index]
-
-            unblanked_output_line = [
-                    cur_net.unit,
-                    ('.%s' % str(cur_net.num)),
-                    cur_pin.conn,
-                    cur_pin.desig,
-                    cur_pin.sig_desc or '',
-                    '',
-                    '',
-                    pcid]
-            output_line = list(unblanked_output_line)
-            pcid += 1
-
-            for field in range(5):
-                if output_line[field] == prev_output_line[field]:
-                    output_line[field] = ''
-                elif field != 1:
-                    break
+        for cur_net, net_rows in itertools.groupby(report_rows,
+                lambda row: (row.unit, row.num)):
+
+            net_pins = []
+            net_cdrs = []
+            for row in net_rows:
+                if row.row_type:
+                    net_cdrs.append((cdr_label(row.cable, row.subcdr, row.kind),
+                            net_label(row.ref_unit, row.ref_num)))
+                else:
+                    net_pins.append(row)
+
+            for cur_pin in net_pins:
+                unblanked_output_line = [
+                        cur_pin.unit,
+                        ('.%s' % str(cur_pin.num)),
+                        cur_pin.conn,
+                        cur_pin.desig,
+                        cur_pin.sig_desc or '',
+                        '',
+                        '',
+                        pcid]
+                output_line = list(unblanked_output_line)
+                pcid += 1
+
+                if pcid_keys is not None:
+                    pcid_keys.append((cur_pin.unit, cur_pin.num,
+                        cur_pin.conn, cur_pin.desig))
+
+                for field in range(5):
+                    if output_line[field] == prev_output_line[field]:
+                        output_line[field] = ''
+                    elif field != 1:
+                        break
 
-            prev_output_line = unblanked_output_line
+                prev_output_line = unblanked_output_line
 
-            if len(output_line[0]):
-                output_lines.append([''] * 7)
+                if len(output_line[0]):
+                    yield [''] * 7
 
-            output_lines.append(output_line)
+                if cur_pin is not net_pins[-1]:
+                    yield output_line
 
-            try:
-                if cur_net == pin_tables_result[index + 1][1]:
-                    continue
-            except IndexError:
-                pass
+            if not net_pins:
+                continue
 
-            for cdr in cur_net.linked_cdrs:
+            # The net's conductors start on the line of its last pin.
+            for cdr, ref_net in net_cdrs:
                 output_line[5] = cdr
-
-                if cur_net == cdr.a_net:
-                    output_line[6] = cdr.b_net
-                else:
-                    output_line[6] = cdr.a_net
-
+                output_line[6] = ref_net
+                yield output_line
                 output_line = [''] * 7
-                output_lines.append(output_line)
 
-            if cur_net.linked_cdrs:
-                del output_lines[-1]
-
-        if show_pcids:
-            t = Tabulator(10, 5, 6, 4, 20, 12, 16, 4)
-        else:
-            t = Tabulator(10, 5, 6, 4, 20, 12, 16, 0)
+            if not net_cdrs:
+                yield output_line
 
-        for line in output_lines:
-            file.write(t(*line) + '\n')
-
-    def cdr_table(self, file):
-
-        if self._link_filter:
-            print "*** Link Filter is ON ***"
-
-        cdr_table_q = self._cdr_table_query()
-        cdr_table_result = list(cdr_table_q)
-
-        output_lines = ['Unit Conn Pin [/] Cdr [/] Pin Conn Unit'.split()]
-        output_lines.append(['' for _ in output_lines[0]])
+    def _cdr_table_lines(self, cdr_table_rows):
+        header_line = 'Unit Conn Pin [/] Cdr [/] Pin Conn Unit'.split()
+        yield header_line
+        yield ['' for _ in header_line]
 
         prev_output_line = [None] * 9
 
-        for index in range(len(cdr_table_result)):
-            cur_cdr, cur_a_pin, cur_b_pin = cdr_table_result[index]
+        for cur_cdr, cur_a_pin, cur_b_pin in cdr_table_rows:
 
             unblanked_output_line = [
                     cur_a_pin.net_unit,
@@ -355,15 +769,361 @@ class Interconnect(object):
                         break
 
             prev_output_line = unblanked_output_line
-            output_lines.append(output_line)
+            yield output_line
+
+    @property
+    def unit_display_filter(self):
+        return self._filter_units
+    @unit_display_filter.setter
+    def unit_display_filter(self, value):
+        self._filter_units = value
+        self._invalidate_view()
 
+    def toggle_link_filter(self):
+        self._link_filter = not self._link_filter
+        self._invalidate_view()
+        return self._link_filter
+
+    def _unit_sections(self, snapshot=False):
+        # Rendered sections are cached per unit until the unit is touched.
+        link_key = self._link_filter and frozenset(self._filter_units or [])
+        units_q = sa.select([net_table.c.unit],
+                order_by=[net_table.c.unit], distinct=True)
+        if self._filter_units:
+            units_q = units_q.where(net_table.c.unit.in_(self._filter_units))
+        units = [r[0] for r in self._execute(units_q)]
+
+        stamps = dict((unit, (self._generation,
+                    self._unit_generations.get(unit, 0), link_key))
+                for unit in units)
+        sections = dict((unit, self._sections[unit]) for unit in units
+                if self._sections.get(unit, (None,))[0] == stamps[unit])
+        stale = [unit for unit in units if unit not in sections]
+
+        if not stale:
+            units_chunks = []
+        elif len(stale) < len(units):
+            units_chunks = chunked(stale)
+        else:
+            units_chunks = [None]
+        report_rows = (self._execute(self._conn_report_query(units=chunk))
+                       for chunk in units_chunks)
+        if snapshot:
+            report_rows = [rows.fetchall() for rows in report_rows]
+
+        def render():
+            # Report rows come ordered by unit, like units.
+            t = Tabulator(10, 5, 6, 4, 20, 12, 16)
+            stale_groups = itertools.groupby(
+                    itertools.chain.from_iterable(report_rows),
+                    lambda row: row.unit)
+            group = next(stale_groups, None)
+            for unit in units:
+                if unit not in sections:
+                    lines, pin_keys = [], []
+                    if group and group[0] == unit:
+                        table_lines = self._conn_table_lines(group[1],
+                                pin_keys)
+                        table_lines.next()
+                        for line in table_lines:
+                            lines.append((t.padded(*line[:7]), line[7:]))
+                        group = next(stale_groups, None)
+                    sections[unit] = self._sections[unit] = \
+                            (stamps[unit], lines, pin_keys)
+                yield sections[unit][1:]
+
+        return len(units), render
+
+    def conn_tables(self, file, show_pcids=True):
+        self._note_link_filter()
+        self._conn_tables_writer(show_pcids)[1](file)
+
+    def _note_link_filter(self):
+        if self._link_filter:
+            print "*** Link Filter is ON ***"
+
+    def snapshot_conn_tables(self):
+        self._note_link_filter()
+        return self._snapshot(
+                lambda ic, snapshot: ic._conn_tables_writer(False, snapshot))
+
+    def _conn_tables_writer(self, show_pcids, snapshot=False):
+
+        if show_pcids:
+            t = Tabulator(10, 5, 6, 4, 20, 12, 16, 4)
+        else:
+            t = Tabulator(10, 5, 6, 4, 20, 12, 16, 0)
+
+        unit_count, unit_sections = self._unit_sections(snapshot)
+
+        def write(file, unit_done=None):
+            # PCIDs run on from one unit's section to the next.
+            pcid_keys = []
+            def table_lines():
+                yield t(*'Unit Net Conn Pin Signal Cdrs Ref Net PCID'.split())
+                for lines, pin_keys in unit_sections():
+                    pcid_base = len(pcid_keys)
+                    for padded, pcid in lines:
+                        if pcid and show_pcids:
+                            padded += t.pad(pcid[0] + pcid_base, 4)
+                        yield padded.rstrip()
+                    pcid_keys.extend(pin_keys)
+                    if unit_done:
+                        unit_done()
+
+            buf = []
+            for line in table_lines():
+                buf.append(line + '\n')
+                if len(buf) >= 256:
+                    file.write(''.join(buf))
+                    buf = []
+            file.write(''.join(buf))
+
+            if show_pcids:
+                self._pcid_keys = pcid_keys
+
+        return unit_count, write
+
+    def unit_conn_tables(self, open_unit_file, units=None):
+        # Each unit is filtered as if it were the only unit in the filter.
+        self._note_link_filter()
+        self._unit_conn_tables_writer(units)[1](open_unit_file)
+
+    def snapshot_unit_conn_tables(self, units=None):
+        self._note_link_filter()
+        return self._snapshot(lambda ic, snapshot:
+                ic._unit_conn_tables_writer(units, snapshot))
+
+    def _unit_conn_tables_writer(self, units, snapshot=False):
+        units_q = sa.select([net_table.c.unit],
+                order_by=[net_table.c.unit], distinct=True)
+        if units is None:
+            units_chunks = [None]
+            units = [r[0] for r in self._execute(units_q)]
+        else:
+            units_chunks = chunked(sorted(units))
+            units = [r[0] for r in self._execute(units_q)
+                     if r[0] in units]
+
+        report_rows = (self._execute(self._conn_report_query(
+                           per_unit=True, units=units_chunk))
+                       for units_chunk in units_chunks)
+        if snapshot:
+            report_rows = [rows.fetchall() for rows in report_rows]
+
+        def write(open_unit_file):
+            t = Tabulator(10, 5, 6, 4, 20, 12, 16, 0)
+
+            def render_unit(unit, unit_rows):
+                output_file = open_unit_file(unit)
+                try:
+                    t.write(output_file, self._conn_table_lines(unit_rows))
+                finally:
+                    output_file.close()
+
+            unrendered = list(units)
+            for rows in report_rows:
+                for unit, unit_rows in itertools.groupby(rows,
+                        lambda row: row.unit):
+                    render_unit(unit, unit_rows)
+                    unrendered.remove(unit)
+
+            for unit in unrendered:
+                render_unit(unit, [])
+
+        return len(units), write
+
+    def journal_mark(self):
+        return self._execute(sa.select(
+                [sa.func.max(change_journal_table.c.seq)])).scalar() or 0
+
+    def changed_units(self, since):
+        # None if a change since then affected every unit.
+        units = set(r[0] for r in self._execute(sa.select(
+                [change_journal_table.c.unit],
+                change_journal_table.c.seq > since, distinct=True)))
+        if None in units:
+            return None
+        return units
+
+    def _read_compact_cdr_table(self):
+        cdrs = conductor_table.c
+        cdr_q = sa.select([cdrs.cable, cdrs.subcdr, cdrs.kind,
+                cdrs.a_net_unit, cdrs.a_net_num,
+                cdrs.b_net_unit, cdrs.b_net_num])
+        if self._filter_units:
+            oper = and_ if self._link_filter else or_
+            cdr_q = cdr_q.where(oper(
+                    cdrs.a_net_unit.in_(self._filter_units),
+                    cdrs.b_net_unit.in_(self._filter_units)))
+        cdr_rows = [tuple(r) for r in self._execute(cdr_q)]
+
+        pins = pin_table.c
+        pins_q = sa.select([pins.net_unit, pins.net_num, pins.conn_sort,
+                    pins.conn, pins.desig_sort, pins.desig],
+                order_by=[pins.net_unit, pins.net_num, pins.conn_sort,
+                    pins.conn, pins.desig_sort, pins.desig])
+        if self._filter_units:
+            units_chunks = chunked(sorted(set(r[3] for r in cdr_rows)
+                    | set(r[5] for r in cdr_rows)))
+        else:
+            units_chunks = [None]
+
+        net_pins = {}
+        for units_chunk in units_chunks:
+            chunk_q = pins_q if units_chunk is None \
+                    else pins_q.where(pins.net_unit.in_(units_chunk))
+            for r in self._execute(chunk_q):
+                net_pins.setdefault(tuple(r[:2]), []).append(tuple(r[2:]))
+
+        return cdr_rows, net_pins
+
+    def _compact_cdr_table(self, cdr_rows, net_pins):
+        # Each end shows the first pin of its net, marked + if it has more.
+        def pin_end(unit, num):
+            net = net_pins.get((unit, num))
+            if not net:
+                return ('', '', '', ''), PinEnd(unit, '', '')
+            first = net[0]
+            return first, PinEnd(unit, first[1],
+                    first[3] + (len(net) > 1 and '+' or ''))
+
+        rows = []
+        shown_nets = set()
+        for cable, subcdr, kind, a_unit, a_num, b_unit, b_num in cdr_rows:
+            a_key, a_end = pin_end(a_unit, a_num)
+            b_key, b_end = pin_end(b_unit, b_num)
+            rows.append(((a_unit,) + a_key + (b_unit,) + b_key
+                        + (cable, subcdr),
+                    (cdr_label(cable, subcdr, kind), a_end, b_end)))
+            shown_nets.add((a_unit, a_num))
+            shown_nets.add((b_unit, b_num))
+        rows.sort()
+
+        multi_pin_nets = [(net, net_pins[net]) for net in sorted(shown_nets)
+                if len(net_pins.get(net, [])) > 1]
+        return [row for _, row in rows], multi_pin_nets
+
+    def cdr_table(self, file, compact=False):
+        self._note_link_filter()
+        self._cdr_table_writer(compact)[1](file)
+
+    def snapshot_cdr_table(self, compact=False):
+        self._note_link_filter()
+        return self._snapshot(
+                lambda ic, snapshot: ic._cdr_table_writer(compact, snapshot))
+
+    def _cdr_table_writer(self, compact, snapshot=False):
+        # The number of units is not known, and given as None.
         t = Tabulator(12, 6, 4, 5, 6, 5, 4, 6, 12)
-        for line in output_lines:
-            file.write(t(*line) + '\n')
+
+        if not compact:
+            cdr_table_rows = self._cdr_table_rows()
+            if snapshot:
+                cdr_table_rows = list(cdr_table_rows)
+
+            def write(file):
+                t.write(file, self._cdr_table_lines(cdr_table_rows))
+            return None, write
+
+        cdr_rows, net_pins = self._read_compact_cdr_table()
+
+        def write(file):
+            cdr_table_rows, multi_pin_nets = self._compact_cdr_table(
+                    cdr_rows, net_pins)
+            t.write(file, self._cdr_table_lines(cdr_table_rows))
+
+            def net_pin_lines():
+                yield ['']
+                yield ['Net', 'Pins']
+                for net, pins in multi_pin_nets:
+                    pin_names = ' '.join('%s/%s' % (pin[1], pin[3])
+                            for pin in pins)
+                    for line_num, line in enumerate(
+                            textwrap.wrap(pin_names, 64)):
+                        yield [line_num == 0 and net_label(*net) or '', line]
+
+            if multi_pin_nets:
+                Tabulator(16, 64).write(file, net_pin_lines())
+        return None, write
+
+    def _snapshot(self, writer):
+        # The returned run(progress, *args) writes the report as it is now.
+        if not self._reads_apart():
+            units, write = writer(self, True)
+            def run(progress, *args):
+                progress.units = units
+                progress.snapshot_taken()
+                write(*args)
+            return run
+
+        reader = self._reader()
+        def run(progress, *args):
+            reader._begin_read()
+            try:
+                progress.snapshot_taken()
+                units, write = writer(reader, False)
+                progress.units = units
+                write(*args)
+            finally:
+                reader._end_read()
+        return run
+
+    def _reads_apart(self):
+        # A SQLite reader only runs beside writers in WAL mode.
+        if self.in_batch or in_memory(self.engine):
+            return False
+        if self.engine.dialect.name != 'sqlite':
+            return True
+        return self._journal_mode() == 'wal'
+
+    def _journal_mode(self):
+        return self.engine.execute('PRAGMA journal_mode').scalar().lower()
+
+    def use_wal(self):
+        # Persists in the file.
+        if self.engine.dialect.name != 'sqlite' or in_memory(self.engine):
+            return False
+        return self.engine.execute(
+                'PRAGMA journal_mode=WAL').scalar().lower() == 'wal'
+
+    def _reader(self):
+        # Shares the section cache, with the unit generations as they are now.
+        reader = copy.copy(self)
+        reader._unit_generations = dict(self._unit_generations)
+        reader._ses = None
+        reader._batch_conn = None
+        reader._batch_trans = None
+        reader._pcid_keys = None
+        reader._completions = None
+        reader._graph = None
+        return reader
+
+    def _begin_read(self):
+        conn = self.engine.connect()
+        try:
+            if conn.dialect.name == 'sqlite':
+                # pysqlite only begins transactions before writes.
+                conn.execute('BEGIN')
+            else:
+                conn = conn.execution_options(
+                        isolation_level='REPEATABLE READ')
+                conn.begin()
+            self._read_conn = conn
+            self.journal_mark()
+        except:
+            self._read_conn = None
+            conn.close()
+            raise
+
+    def _end_read(self):
+        conn, self._read_conn = self._read_conn, None
+        conn.close()
 
     def add_cdr(self, a_unit, a_conn, a_pin,
             b_unit, b_conn, b_pin, cable=None):
         s = self._get_ses()
+        new_pins = []
 
         def find_or_create_pin_net(unit, conn, pin):
             q = s.query(Pin).add_entity(Net).join('net') \
@@ -382,6 +1142,7 @@ class Interconnect(object):
                 print " - creating pin %s/%s/%s, net %s" % (
                         unit, conn, pin, repr(the_net))
                 s.add(the_net)
+                new_pins.append((the_net, the_pin))
                 return the_net
 
         pin_a_net = find_or_create_pin_net(a_unit, a_conn, a_pin)
@@ -395,7 +1156,166 @@ class Interconnect(object):
         print pin_b_net
         print new_cdr
 
+        if self._graph is not None:
+            for net, pin in new_pins:
+                self._graph.add_pin((net.unit, net.num), pin.conn, pin.desig)
+            self._graph.add_cdr((new_cdr.cable, new_cdr.subcdr),
+                    (pin_a_net.unit, pin_a_net.num),
+                    (pin_b_net.unit, pin_b_net.num), new_cdr.kind)
+
         self._close_ses()
+        self._invalidate([a_unit, b_unit])
+
+    def import_cdrs(self, rows):
+        cdr_rows = []
+        for row in rows:
+            fields = [field.strip() for field in row]
+            fields += [''] * (8 - len(fields))
+            if len(fields) != 8 or not all(fields[:6]):
+                raise ValueError('bad import row: %s' % ', '.join(row))
+
+            a_end, b_end = tuple(fields[0:3]), tuple(fields[3:6])
+            cable = fields[6] and int(fields[6]) or None
+            cdr_rows.append((a_end, b_end, cable, fields[7] or 'C'))
+
+        new_cdrs, new_pins, new_nets = self._add_cdrs(cdr_rows)
+
+        print " - imported %d conductors, %d new pins on %d new nets" % (
+                len(new_cdrs), len(new_pins), len(new_nets))
+
+    def add_cable(self, a_unit, a_conn, a_pins, b_unit, b_conn, b_pins,
+            kind='C'):
+        if len(a_pins) != len(b_pins):
+            raise ValueError('%d a-side pins but %d b-side pins' % (
+                len(a_pins), len(b_pins)))
+
+        cdr_rows = [((a_unit, a_conn, a_pin), (b_unit, b_conn, b_pin),
+                    None, kind)
+                for a_pin, b_pin in zip(a_pins, b_pins)]
+        new_cdrs, new_pins, new_nets = self._add_cdrs(cdr_rows,
+                new_cable=True)
+
+        print " - created cable %s with %d conductors, %d new pins" % (
+                cdr_label(new_cdrs[0]['cable'], None, 'C'),
+                len(new_cdrs), len(new_pins))
+
+    def _add_cdrs(self, cdr_rows, new_cable=False):
+        # A cable of None means a new cable.
+        units = set(end[0] for cdr_row in cdr_rows for end in cdr_row[:2])
+
+        self._close_ses()
+        conn = self._connect()
+        trans = conn.begin()
+        try:
+            # Pins are looked up set-based and IDs reserved in blocks.
+            pin_nets = {}
+            for units_chunk in chunked(units):
+                pins_q = sa.select(
+                        [pin_table.c.net_unit, pin_table.c.conn,
+                            pin_table.c.desig, pin_table.c.net_num],
+                        pin_table.c.net_unit.in_(units_chunk))
+                for r in conn.execute(pins_q):
+                    pin_nets[tuple(r[:3])] = r[3]
+
+            new_ends = []
+            for cdr_row in cdr_rows:
+                for end in cdr_row[:2]:
+                    if end not in pin_nets:
+                        pin_nets[end] = None
+                        new_ends.append(end)
+
+            new_net_counts = {}
+            for unit, _, _ in new_ends:
+                new_net_counts[unit] = new_net_counts.get(unit, 0) + 1
+            net_nums = dict((unit, net_num_allocator.reserve(conn, unit, count))
+                    for unit, count in new_net_counts.items())
+
+            new_nets = []
+            new_pins = []
+            for end in new_ends:
+                unit, conn_name, desig = end
+                pin_nets[end] = net_nums[unit]
+                net_nums[unit] += 1
+                new_nets.append({'unit': unit, 'num': pin_nets[end]})
+                new_pins.append(dict(pin_sort_keys(conn_name, desig),
+                    net_unit=unit, net_num=pin_nets[end], conn=conn_name,
+                    desig=desig))
+
+            cables = set(cdr_row[2] for cdr_row in cdr_rows) - set([None])
+            if cables:
+                cable_allocator.advance(conn, '', max(cables))
+
+            new_cable_count = 1 if new_cable else \
+                    [cdr_row[2] for cdr_row in cdr_rows].count(None)
+            if new_cable_count:
+                next_cable = cable_allocator.reserve(conn, '',
+                        new_cable_count)
+
+            cdr_cables = []
+            for cdr_row in cdr_rows:
+                if cdr_row[2] is not None:
+                    cdr_cables.append(cdr_row[2])
+                elif new_cable:
+                    cdr_cables.append(next_cable)
+                else:
+                    cdr_cables.append(next_cable)
+                    next_cable += 1
+
+            cable_counts = {}
+            for cable in cdr_cables:
+                cable_counts[cable] = cable_counts.get(cable, 0) + 1
+
+            # Cables without conductors or a high-water mark number from 1.
+            used_cables = subcdr_allocator.tracked(conn, cable_counts)
+            for cables_chunk in chunked(cable_counts):
+                used_cables.update(str(r[0]) for r in conn.execute(sa.select(
+                        [conductor_table.c.cable],
+                        conductor_table.c.cable.in_(cables_chunk),
+                        distinct=True)))
+            subcdrs = {}
+            for cable, count in cable_counts.items():
+                if str(cable) in used_cables:
+                    subcdrs[cable] = subcdr_allocator.reserve(conn, cable,
+                            count)
+                else:
+                    subcdrs[cable] = 1
+
+            new_cdrs = []
+            for (a_end, b_end, _, kind), cable in zip(cdr_rows, cdr_cables):
+                new_cdrs.append({'a_net_unit': a_end[0],
+                    'a_net_num': pin_nets[a_end], 'b_net_unit': b_end[0],
+                    'b_net_num': pin_nets[b_end], 'kind': kind,
+                    'cable': cable, 'subcdr': subcdrs[cable]})
+                subcdrs[cable] += 1
+
+            if new_nets:
+                conn.execute(net_table.insert(), new_nets)
+            if new_pins:
+                conn.execute(pin_table.insert(), new_pins)
+            if new_cdrs:
+                conn.execute(conductor_table.insert(), new_cdrs)
+            journal_units(conn, units)
+
+            trans.commit()
+
+            if self._graph is not None:
+                for pin in new_pins:
+                    self._graph.add_pin((pin['net_unit'], pin['net_num']),
+                            pin['conn'], pin['desig'])
+                for cdr in new_cdrs:
+                    self._graph.add_cdr((cdr['cable'], cdr['subcdr']),
+                            (cdr['a_net_unit'], cdr['a_net_num']),
+                            (cdr['b_net_unit'], cdr['b_net_num']), cdr['kind'])
+
+        except:
+            trans.rollback()
+            raise
+
+        finally:
+            self._disconnect(conn)
+            self._invalidate(units)
+
+        return new_cdrs, new_pins, new_nets
 
     def add_pin(self, unit, conn, pin, net_num):
         s = self._get_ses()
@@ -405,107 +1325,338 @@ class Interconnect(object):
 
         the_pin = Pin(conn, pin)
         existing_net.linked_pins.append(the_pin)
-        s.flush()
+        self._flush()
+
+        if self._graph is not None:
+            self._graph.add_pin((unit, net_num), conn, pin)
 
         self._close_ses()
+        self._invalidate([unit])
 
     def del_cdr(self, cable, subcdr):
         self._close_ses()
-        conductor_table.delete(and_(conductor_table.c.cable == cable,
-                conductor_table.c.subcdr == subcdr)).execute()
+        conn = self._connect()
+        try:
+            cdr_match = and_(conductor_table.c.cable == cable,
+                    conductor_table.c.subcdr == subcdr)
+            units = self._cdr_units(conn, cdr_match)
+            conn.execute(conductor_table.delete(cdr_match))
+            subcdr_allocator.reset(conn, [cable])
+            journal_units(conn, units)
+        finally:
+            self._disconnect(conn)
+
+        if self._graph is not None:
+            self._graph.remove_cdr((cable, subcdr))
+        self._invalidate(units)
 
     def desc_pin(self, pin_cid, desc):
-        pin = self._pin_table_query()[pin_cid][0]
-        pin.sig_desc = desc
-        self._get_ses().flush()
+        self.desc_pins([pin_cid], desc)
+
+    def desc_pins(self, pin_cids, desc):
+        pin_pks = self._pin_keys_for_cids(pin_cids)
+        units = set(pin_pk['pk_net_unit'] for pin_pk in pin_pks)
         self._close_ses()
+        conn = self._connect()
+        try:
+            conn.execute(pin_table.update(pin_pk_match,
+                    values={'sig_desc': desc}), pin_pks)
+            journal_units(conn, units)
+        finally:
+            self._disconnect(conn)
+        self._touch(units)
 
     def del_pin(self, pin_cid):
-        pin = self._pin_table_query()[pin_cid][0]
-        s = self._get_ses()
-        s.delete(pin)
-        s.flush()
+        self.del_pins([pin_cid])
+
+    def del_pins(self, pin_cids):
+        pin_pks = self._pin_keys_for_cids(pin_cids)
         self._close_ses()
+        units = set(pin_pk['pk_net_unit'] for pin_pk in pin_pks)
+        conn = self._connect()
+        try:
+            conn.execute(pin_table.delete(pin_pk_match), pin_pks)
+            journal_units(conn, units)
+        finally:
+            self._disconnect(conn)
+
+        if self._graph is not None:
+            for pin_pk in pin_pks:
+                self._graph.remove_pin((pin_pk['pk_net_unit'],
+                    pin_pk['pk_net_num']), pin_pk['pk_conn'],
+                    pin_pk['pk_desig'])
+        self._invalidate(units)
 
     def rename_pin(self, pin_cid, conn, desig):
-        pin = self._pin_table_query()[pin_cid][0]
+        pin_pk = self._pin_keys_for_cids([pin_cid])[0]
+        net = (pin_pk['pk_net_unit'], pin_pk['pk_net_num'])
+        pin = self._get_ses().query(Pin).get(
+                net + (pin_pk['pk_conn'], pin_pk['pk_desig']))
         pin.conn = conn
         pin.desig = desig
-        self._get_ses().flush()
+        self._flush()
+
+        if self._graph is not None:
+            self._graph.remove_pin(net, pin_pk['pk_conn'], pin_pk['pk_desig'])
+            self._graph.add_pin(net, conn, desig)
+
         self._close_ses()
+        self._invalidate([net[0]])
 
     def del_net(self, unit, net_num):
-        s = self._get_ses()
-        net = s.query(Net).get([unit, net_num])
-        s.delete(net)
-        s.flush()
+        cdrs = conductor_table.c
+        self._delete(
+                or_(and_(cdrs.a_net_unit == unit, cdrs.a_net_num == net_num),
+                    and_(cdrs.b_net_unit == unit, cdrs.b_net_num == net_num)),
+                and_(pin_table.c.net_unit == unit,
+                    pin_table.c.net_num == net_num),
+                and_(net_table.c.unit == unit, net_table.c.num == net_num))
+
+    def del_cable(self, cable):
+        self._delete(conductor_table.c.cable == cable)
+
+    def del_unit(self, unit):
+        cdrs = conductor_table.c
+        self._delete(or_(cdrs.a_net_unit == unit, cdrs.b_net_unit == unit),
+                pin_table.c.net_unit == unit, net_table.c.unit == unit)
+
+    def _delete(self, cdr_match, pin_match=None, net_match=None):
+        # Remaining conductors of each cable are compacted in one pass.
         self._close_ses()
+        conn = self._connect()
+        self._create_scratch(conn, deleted_cdr_table)
+        trans = conn.begin()
+        units = None
+        try:
+            cdrs = conductor_table.c
+            deleted = deleted_cdr_table.c
+
+            deleted_cdrs = [{'cable': r.cable, 'subcdr': r.subcdr}
+                    for r in conn.execute(
+                        sa.select([cdrs.cable, cdrs.subcdr], cdr_match))]
+            if deleted_cdrs:
+                conn.execute(deleted_cdr_table.insert(), deleted_cdrs)
+
+            # Compaction renames the other conductors of the cables too.
+            in_deleted_cable = cdrs.cable.in_(sa.select([deleted.cable]))
+            units = self._cdr_units(conn, in_deleted_cable)
+            net_units = set()
+            for match, unit_col, match_units in [
+                    (pin_match, pin_table.c.net_unit, units),
+                    (net_match, net_table.c.unit, net_units)]:
+                if match is not None:
+                    match_units.update(r[0] for r in conn.execute(
+                        sa.select([unit_col], match, distinct=True)))
+            units |= net_units
+
+            conn.execute(conductor_table.delete(cdr_match))
+
+            deleted_below = sa.select([sa.func.count(deleted.subcdr)],
+                    and_(deleted.cable == cdrs.cable,
+                        deleted.subcdr < cdrs.subcdr)).as_scalar()
+            conn.execute(conductor_table.update(
+                    and_(in_deleted_cable, deleted_below > 0),
+                    {'subcdr': -(cdrs.subcdr - deleted_below)}))
+            conn.execute(conductor_table.update(cdrs.subcdr < 0,
+                    {'subcdr': -cdrs.subcdr}))
+            subcdr_allocator.reset(conn,
+                    set(cdr['cable'] for cdr in deleted_cdrs))
+
+            if pin_match is not None:
+                conn.execute(pin_table.delete(pin_match))
+            if net_match is not None:
+                conn.execute(net_table.delete(net_match))
+                net_num_allocator.reset(conn, net_units)
+
+            journal_units(conn, units)
+            trans.commit()
+
+        except:
+            trans.rollback()
+            raise
+
+        finally:
+            self._drop_scratch(conn, deleted_cdr_table)
+            self._disconnect(conn)
+            self._invalidate(units)
+            self._graph = None
+
+    def _completion_indexes(self):
+        if self._completions is None:
+            pn_j = sa.outerjoin(net_table, pin_table,
+                    onclause=pin_to_net_join)
+            unit_conns_q = sa.select([net_table.c.unit, pin_table.c.conn],
+                    from_obj=[pn_j], distinct=True)
+
+            unit_conns = {}
+            for unit, conn in self._execute(unit_conns_q):
+                unit_conns.setdefault(unit, [])
+                if conn is not None:
+                    unit_conns[unit].append(conn)
+
+            self._completions = (PrefixIndex(unit_conns),
+                    dict((unit, PrefixIndex(conns))
+                         for unit, conns in unit_conns.items()))
+
+        return self._completions
 
     def complete_unit(self, prefix):
-        compl_r = sa.select([net_table.c.unit],
-            whereclause=net_table.c.unit.like(prefix + '%'),
-            order_by=[net_table.c.unit], distinct=True).execute()
-        return [ r[0] + ' ' for r in compl_r ]
+        unit_index, _ = self._completion_indexes()
+        return [ unit + ' ' for unit in unit_index(prefix) ]
 
     def complete_conn(self, unit, prefix):
-        pn_j = sa.join(pin_table, net_table, onclause=pin_to_net_join)
-        compl_r = sa.select([pin_table.c.conn],
-            whereclause=and_(
-                net_table.c.unit==unit,
-                pin_table.c.conn.like(prefix +'%')
-                ),
-            from_obj=[pn_j],
-            order_by=[pin_table.c.conn], distinct=True).execute()
-        return [ r[0] + ' ' for r in compl_r ]
+        _, conn_indexes = self._completion_indexes()
+        conn_index = conn_indexes.get(unit, PrefixIndex([]))
+        return [ conn + ' ' for conn in conn_index(prefix) ]
+
+    def _connectivity(self):
+        # Read once, then kept up to date until nets or conductors renumber.
+        if self._graph is None:
+            graph = ConnectivityGraph()
+            for r in self._execute(sa.select(
+                    [net_table.c.unit, net_table.c.num])):
+                graph.add_net(tuple(r))
+            for r in self._execute(sa.select(
+                    [pin_table.c.net_unit, pin_table.c.net_num,
+                        pin_table.c.conn, pin_table.c.desig])):
+                graph.add_pin((r.net_unit, r.net_num), r.conn, r.desig)
+            for r in self._execute(conductor_table.select()):
+                graph.add_cdr((r.cable, r.subcdr), (r.a_net_unit, r.a_net_num),
+                        (r.b_net_unit, r.b_net_num), r.kind)
+            self._graph = graph
+
+        return self._graph
+
+    def _pin_end_net(self, unit, conn, desig):
+        net = self._connectivity().pin_net(unit, conn, desig)
+        if net is None:
+            raise RuntimeError('No pin %s/%s/%s' % (unit, conn, desig))
+        return net
+
+    def signal_pins(self, unit, conn, desig):
+        return self._connectivity().signal_pins(
+                self._pin_end_net(unit, conn, desig))
+
+    def connected(self, a_end, b_end):
+        return self._connectivity().connected(
+                self._pin_end_net(*a_end), self._pin_end_net(*b_end))
+
+    def signal_path(self, a_end, b_end):
+        return self._connectivity().path(
+                self._pin_end_net(*a_end), self._pin_end_net(*b_end))
+
+    def trace(self, file, unit, conn, desig, to_end=None):
+        graph = self._connectivity()
+        start_net = self._pin_end_net(unit, conn, desig)
+
+        if to_end:
+            steps = graph.path(start_net, self._pin_end_net(*to_end))
+            if steps is None:
+                print "*** %s/%s/%s is not connected to %s/%s/%s" % (
+                        (unit, conn, desig) + tuple(to_end))
+                return
+            tree = [(start_net, 0, None, None)]
+            for cdr, net in steps:
+                tree.append((net, len(tree), cdr, tree[-1][0]))
+        else:
+            tree = graph.spanning_tree(start_net)
+
+        def trace_lines():
+            yield 'Unit Net Conn Pin Hops Via From'.split()
+            prev_unit = None
+            for net, hops, cdr, from_net in tree:
+                via = cdr and cdr_label(cdr[0], cdr[1], graph.cdr_kind(cdr))
+                output_line = [net[0], '.%s' % net[1], '', '', hops,
+                        via or '', from_net and net_label(*from_net) or '']
+                if net[0] == prev_unit:
+                    output_line[0] = ''
+                else:
+                    yield [''] * 7
+                prev_unit = net[0]
+
+                net_pins = sorted(graph.net_pins(net), key=lambda pin: (
+                        natural_sort_key(pin[0]), pin[0],
+                        natural_sort_key(pin[1]), pin[1]))
+                prev_conn = None
+                for pin_conn, pin_desig in net_pins or [('', '')]:
+                    output_line[2] = pin_conn != prev_conn and pin_conn or ''
+                    output_line[3] = pin_desig
+                    prev_conn = pin_conn
+                    yield output_line
+                    output_line = [''] * 7
+
+        t = Tabulator(10, 5, 6, 4, 5, 12, 16)
+        t.write(file, trace_lines())
+
+        pin_count = sum(len(graph.net_pins(net)) for net, _, _, _ in tree)
+        print " - %d pins on %d nets in %d units" % (pin_count, len(tree),
+                len(set(net[0] for net, _, _, _ in tree)))
 
     def renumber_nets(self, unit):
-        conn = meta.bind.connect()
+        # unit of None means every unit.
+        self._close_ses()
+        conn = self._connect()
+        self._create_scratch(conn, net_renumber_table)
         trans = conn.begin()
+        touched_units = None
         try:
 
             nets_sorted_j = sa.outerjoin(net_table, pin_table,
                     onclause = pin_to_net_join)
             nets_sorted_q = sa.select(
                     [net_table.c.unit, net_table.c.num,
+                        sa.func.min(pin_table.c.conn_sort)
+                            .label('natural_conn_sort'),
                         sa.func.min(pin_table.c.conn)
                             .label('lexical_conn_sort'),
-                        sa.func.min(sa.cast(pin_table.c.conn, sa.Integer))
-                            .label('numeric_conn_sort'),
+                        sa.func.min(pin_table.c.desig_sort)
+                            .label('natural_pin_sort'),
                         sa.func.min(pin_table.c.desig)
-                            .label('lexical_pin_sort'),
-                        sa.func.min(sa.cast(pin_table.c.desig, sa.Integer))
-                            .label('numeric_pin_sort')],
+                            .label('lexical_pin_sort')],
                     from_obj = [nets_sorted_j],
-                    whereclause = net_table.c.unit==unit,
                     group_by = [net_table.c.unit, net_table.c.num],
                     order_by = [net_table.c.unit,
-                        'numeric_conn_sort', 'lexical_conn_sort',
-                        'numeric_pin_sort', 'lexical_pin_sort'])
-            nets_sorted = list(conn.execute(nets_sorted_q))
+                        'natural_conn_sort', 'lexical_conn_sort',
+                        'natural_pin_sort', 'lexical_pin_sort'])
+            if unit is not None:
+                nets_sorted_q = nets_sorted_q.where(net_table.c.unit==unit)
+
+            renumbering = []
+            for unit_name, unit_nets in itertools.groupby(
+                    conn.execute(nets_sorted_q), lambda row: row.unit):
+                for new_num, net in enumerate(unit_nets):
+                    print net, '->', new_num + 1
+                    renumbering.append({'unit': net.unit,
+                        'old_num': net.num, 'new_num': new_num + 1})
+
+            if renumbering:
+                conn.execute(net_renumber_table.insert(), renumbering)
 
             # This is a marginal hack to avoid having to do more magic to keep
             # from breaking PK uniqueness constraints. Update each reference to
-            # the old net number with the negation of the new net number...
-            for index in range(len(nets_sorted)):
-                new_num = index + 1
-                print nets_sorted[index], '->', new_num
-
-                conn.execute(net_table.update(
-                    and_(net_table.c.unit==nets_sorted[index].unit,
-                         net_table.c.num==nets_sorted[index].num),
-                    {'num': -new_num}))
-                conn.execute(pin_table.update(
-                    and_(pin_table.c.net_unit==nets_sorted[index].unit,
-                         pin_table.c.net_num==nets_sorted[index].num),
-                    {'net_num': -new_num}))
-                conn.execute(conductor_table.update(
-                    and_(conductor_table.c.a_net_unit==nets_sorted[index].unit,
-                         conductor_table.c.a_net_num==nets_sorted[index].num),
-                    {'a_net_num': -new_num}))
-                conn.execute(conductor_table.update(
-                    and_(conductor_table.c.b_net_unit==nets_sorted[index].unit,
-                         conductor_table.c.b_net_num==nets_sorted[index].num),
-                    {'b_net_num': -new_num}))
+            # an old net number with the negation of the new net number...
+            rt = net_renumber_table.c
+            def renumbered(unit_col, num_col):
+                match = and_(rt.unit==unit_col, rt.old_num==num_col)
+                return (sa.exists([rt.new_num], match),
+                        -sa.select([rt.new_num], match).as_scalar())
+
+            has_new_num, neg_new_num = renumbered(
+                    net_table.c.unit, net_table.c.num)
+            conn.execute(net_table.update(has_new_num,
+                {'num': neg_new_num}))
+            has_new_num, neg_new_num = renumbered(
+                    pin_table.c.net_unit, pin_table.c.net_num)
+            conn.execute(pin_table.update(has_new_num,
+                {'net_num': neg_new_num}))
+            has_new_num, neg_new_num = renumbered(
+                    conductor_table.c.a_net_unit, conductor_table.c.a_net_num)
+            conn.execute(conductor_table.update(has_new_num,
+                {'a_net_num': neg_new_num}))
+            has_new_num, neg_new_num = renumbered(
+                    conductor_table.c.b_net_unit, conductor_table.c.b_net_num)
+            conn.execute(conductor_table.update(has_new_num,
+                {'b_net_num': neg_new_num}))
 
             # ...then bulk-update all net number references to the absolute
             # value of themselves.
@@ -522,6 +1673,16 @@ class Interconnect(object):
                 conductor_table.c.b_net_num<0,
                 {'b_net_num': sa.func.abs(conductor_table.c.b_net_num)}))
 
+            net_num_allocator.reset(conn,
+                    set(net['unit'] for net in renumbering))
+
+            # The unit's nets are also shown on units its conductors reach.
+            if unit is not None:
+                touched_units = self._cdr_units(conn, or_(
+                        conductor_table.c.a_net_unit == unit,
+                        conductor_table.c.b_net_unit == unit)) | set([unit])
+            journal_units(conn, touched_units)
+
             trans.commit()
 
         except:
@@ -529,67 +1690,89 @@ class Interconnect(object):
             raise
 
         finally:
-            conn.close()
-            self._close_ses()
+            self._drop_scratch(conn, net_renumber_table)
+            self._disconnect(conn)
+            self._invalidate(touched_units)
+            self._graph = None
 
     def reorient_cdrs(self):
-        conn = meta.bind.connect()
+        # Conductors end up running from the later unit in fan order.
+        self._close_ses()
+        conn = self._connect()
+        self._create_scratch(conn, unit_rank_table)
+        trans = conn.begin()
         try:
-            net_cdr_j = sa.outerjoin(net_table, conductor_table,
-                    onclause=net_to_cdr_join)
+            net_cdr_j = sa.outerjoin(net_table, cdr_ends,
+                    onclause=net_to_cdr_ends_join)
             unit_fan_order_q = sa.select(
                     [net_table.c.unit,
-                     sa.func.count(conductor_table.c.cable)
+                     sa.func.count(cdr_ends.c.cable)
                          .label('cdr_count')],
                     from_obj=[net_cdr_j],
                     group_by=[net_table.c.unit],
                     order_by=[sa.asc('cdr_count'), net_table.c.unit])
-            unit_fan_order = [r[0] for r in conn.execute(unit_fan_order_q)]
-
-        finally:
-            conn.close()
+            unit_ranks = [{'unit': r[0], 'fan_rank': fan_rank}
+                    for fan_rank, r in enumerate(conn.execute(unit_fan_order_q))]
+            if unit_ranks:
+                conn.execute(unit_rank_table.insert(), unit_ranks)
+
+            cdrs = conductor_table.c
+            def fan_rank(unit_col):
+                return sa.select([unit_rank_table.c.fan_rank],
+                        unit_rank_table.c.unit == unit_col).as_scalar()
+            swap_match = or_(cdrs.a_net_unit == cdrs.b_net_unit,
+                    fan_rank(cdrs.b_net_unit) > fan_rank(cdrs.a_net_unit))
+
+            # The SET expressions all see the row as it was before the update.
+            journal_units(conn, self._cdr_units(conn, swap_match))
+            conn.execute(conductor_table.update(swap_match, {
+                    'a_net_unit': cdrs.b_net_unit,
+                    'a_net_num': cdrs.b_net_num,
+                    'b_net_unit': cdrs.a_net_unit,
+                    'b_net_num': cdrs.a_net_num}))
 
-        s = self._get_ses()
-        s.begin()
-        try:
-            for unit in unit_fan_order:
-                b_cdrs = (s.query(Conductor)
-                          .options(orm.joinedload('a_net'),
-                                 orm.joinedload('b_net'))
-                          .filter(Conductor.b_net_unit==unit))
-                for cdr in b_cdrs:
-                    cdr.swap_orientation()
-                s.flush()
-            s.commit()
+            trans.commit()
 
         except:
-            s.rollback()
+            trans.rollback()
             raise
+
         finally:
-            self._close_ses()
+            self._drop_scratch(conn, unit_rank_table)
+            self._disconnect(conn)
 
     def set_cdr_kind(self, cable, subcdr, new_kind):
         s = self._get_ses()
         cdr = s.query(Conductor).get([cable, subcdr])
         cdr.kind = new_kind
-        s.update(cdr)
-        s.flush()
+        units = [cdr.a_net_unit, cdr.b_net_unit]
+        self._flush()
         self._close_ses()
+        self._touch(units)
+        self._graph = None
 
     def set_cdr_sub(self, cable, subcdr, new_subcdr):
         self._close_ses()
-        cdrs = conductor_table.select(
+        cdrs = self._execute(conductor_table.select(
                 and_(conductor_table.c.cable == cable,
                      conductor_table.c.subcdr == new_subcdr)
-                ).count().execute()
+                ).count())
 
         if list(cdrs)[0][0]:
             raise RuntimeError(
                 'The cable has a conductor with that ID already.')
 
-        conductor_table.update(
-                values={conductor_table.c.subcdr: new_subcdr},
-                whereclause=and_(
-                    conductor_table.c.subcdr == subcdr,
+        conn = self._connect()
+        try:
+            cdr_match = and_(conductor_table.c.subcdr == subcdr,
                     conductor_table.c.cable == cable)
-                ).execute()
+            units = self._cdr_units(conn, cdr_match)
+            conn.execute(conductor_table.update(
+                    values={conductor_table.c.subcdr: new_subcdr},
+                    whereclause=cdr_match))
+            subcdr_allocator.reset(conn, [cable])
+            journal_units(conn, units)
+        finally:
+            self._disconnect(conn)
+        self._touch(units)
+        self._graph = None
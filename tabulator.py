@@ -3,10 +3,22 @@ class Tabulator(object):
         self._field_widths = list(args)
 
     def __call__(self, *args):
+        return self.padded(*args).rstrip()
+
+    def padded(self, *args):
         return ''.join(self.pad(arg, width)
                        for arg, width
-                       in zip(args, self._field_widths)).rstrip()
+                       in zip(args, self._field_widths))
 
     def pad(self, s, width):
         s_trunc = str(s)[:width]
         return s_trunc + ' ' * (int(width) - len(s_trunc))
+
+    def write(self, file, rows, batch_lines=256):
+        buf = []
+        for row in rows:
+            buf.append(self(*row) + '\n')
+            if len(buf) >= batch_lines:
+                file.write(''.join(buf))
+                buf = []
+        file.write(''.join(buf))